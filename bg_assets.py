@@ -0,0 +1,143 @@
+"""背景图资源
+
+上传的背景图只在第一次出现时处理一次：按最长边 MAX_SIDE 等比缩小、压平透明通道、重新压缩成 JPEG，
+以原始内容的 sha256 命名存放 (同一张图重复上传不会再处理、也不会再写盘)。
+另存一份 INLINE_SIDE 的小图，没有静态文件服务、只能内联进页面时用它。
+当前使用哪张图记在 current.json 里，只有换图时才改写。
+
+    store = BackgroundStore(os.path.join(BASE_DIR, '.assets'))
+    digest = store.add(sha256, uploaded.getvalue())   # 已有则直接返回
+    store.set_current(digest)
+    css = background_css(store.inline_path(digest), 0.85)   # 内联小图 (data URI)
+    css = background_css(None, 0.85, url="app/static/...")  # 或者走静态文件服务
+"""
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+
+from PIL import Image, ImageOps
+
+# 缩放后的最长边 (像素) 与 JPEG 质量；全屏背景再大也看不出区别
+MAX_SIDE = 1920
+JPEG_QUALITY = 80
+
+# 内联版本：每次整页重跑都随页面发送，只求有个大致的画面 (遮罩之下看不出细节)
+INLINE_SIDE = 480
+INLINE_QUALITY = 55
+
+# 透明区域压平到与遮罩相同的底色
+MATTE = (243, 244, 246)
+
+
+def _recompress(data, max_side=MAX_SIDE, quality=JPEG_QUALITY):
+    """原始图片字节 → 缩小并重新压缩后的 JPEG 字节"""
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        flat = Image.new('RGB', img.size, MATTE)
+        flat.paste(img, mask=img.getchannel('A'))
+        img = flat
+    else:
+        img = img.convert('RGB')
+    out = io.BytesIO()
+    img.save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+class BackgroundStore:
+    """按内容哈希存放处理后的背景图 (线程安全，进程内各会话共享)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self._current = None  # 最近一次读到 / 写入的 current.json 内容
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.directory, f"{digest}.jpg")
+
+    def inline_path(self, digest):
+        """内联用的小图；旧版本只存了大图时从大图补生成"""
+        target = os.path.join(self.directory, f"{digest}-inline.jpg")
+        if not os.path.exists(target):
+            with open(self.path(digest), 'rb') as f:
+                self._write(target, _recompress(f.read(), INLINE_SIDE, INLINE_QUALITY))
+        return target
+
+    @staticmethod
+    def _write(target, data):
+        tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, target)
+
+    def add(self, digest, data):
+        """处理并保存一张图 (大图 + 内联小图)，返回 digest；同一内容已经处理过时什么都不做"""
+        target = self.path(digest)
+        if os.path.exists(target):
+            return digest
+        self._write(os.path.join(self.directory, f"{digest}-inline.jpg"),
+                    _recompress(data, INLINE_SIDE, INLINE_QUALITY))
+        self._write(target, _recompress(data))
+        return digest
+
+    def add_file(self, file_path):
+        """导入磁盘上已有的图片 (旧版本留下的 bg_image.png)"""
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        return self.add(hashlib.sha256(data).hexdigest(), data)
+
+    def current(self):
+        """当前背景图的 digest，没有设置或文件已丢失时为 None"""
+        with self.lock:
+            if self._current is None:
+                try:
+                    with open(os.path.join(self.directory, 'current.json'), encoding='utf-8') as f:
+                        self._current = json.load(f).get('digest') or ''
+                except (OSError, ValueError):
+                    self._current = ''
+            digest = self._current
+        return digest if digest and os.path.exists(self.path(digest)) else None
+
+    def set_current(self, digest):
+        """切换当前背景图；与现在相同时不写文件"""
+        if digest == self.current():
+            return
+        with self.lock:
+            pointer = os.path.join(self.directory, 'current.json')
+            tmp = f"{pointer}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'digest': digest}, f)
+            os.replace(tmp, pointer)
+            self._current = digest
+
+    def publish_static(self, digest, static_dir):
+        """复制到 Streamlit 的静态文件目录，返回相对 static 的文件名 (已存在则不复制)"""
+        name = f"bg-{digest[:16]}.jpg"
+        target = os.path.join(static_dir, name)
+        if not os.path.exists(target):
+            os.makedirs(static_dir, exist_ok=True)
+            shutil.copyfile(self.path(digest), target)
+        return name
+
+
+def background_css(image_path, opacity, url=None):
+    """背景样式：给出 url 时引用静态文件，否则把 (已缩小的) 图片内联成 data URI"""
+    if url is None:
+        with open(image_path, 'rb') as f:
+            url = "data:image/jpeg;base64," + base64.b64encode(f.read()).decode()
+    return f"""
+        <style>
+        .stApp {{
+            background-image: linear-gradient(rgba(243, 244, 246, {opacity}), rgba(243, 244, 246, {opacity})), url({url});
+            background-size: cover;
+            background-position: center;
+            background-attachment: fixed;
+        }}
+        </style>
+    """
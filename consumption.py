@@ -0,0 +1,222 @@
+"""消耗量汇总与补货预测
+
+从库存事件日志 (stock_events.py) 增量消费出库类事件，按 零件 × 天、零件 × 周 累计消耗量。
+查询只读汇总表，不再回头扫描原始历史；日汇总保留 DAILY_RETENTION 天，周汇总保留 WEEKLY_RETENTION 周。
+
+    rollup = ConsumptionRollup(log, "stock_events/rollup")
+    rollup.refresh()                              # 只处理上次之后的新事件
+    plan = forecast(df, rollup.daily_rate('screws', 28), lead_days=7, cover_days=30, low=20)
+
+汇总与已消费的偏移量一起持久化：平时只追加本批增量，定期才重写完整汇总，重启后不会重复计数。
+"""
+import json
+import os
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from row_ids import ID_COL
+from stock_events import Subscriber, OUTBOUND, BOM_DEDUCT, MANUAL_EDIT
+
+# 计入消耗的事件：出库、BOM 扣减、表格里手动把数量改小 (删除整行是 REMOVED，不计入)
+CONSUMING_KINDS = (OUTBOUND, BOM_DEDUCT, MANUAL_EDIT)
+
+DAILY_RETENTION = 120
+WEEKLY_RETENTION = 104
+
+# 增量文件攒到这么多行就合并进完整汇总
+COMPACT_EVERY = 500
+
+
+def _week_of(day):
+    """日期字符串 → 所在周的周一"""
+    d = date.fromisoformat(day)
+    return (d - timedelta(days=d.weekday())).isoformat()
+
+
+class ConsumptionRollup:
+    """按天 / 按周累计的消耗量 (线程安全，进程内各会话共享)
+
+    持久化分两部分：<name>.json 是某个偏移量处的完整汇总，<name>.delta.jsonl 逐批追加之后的增量
+    (每行带处理到的偏移量)。refresh 只追加本批的增量；增量攒到 COMPACT_EVERY 行或跨天需要清理旧数据时，
+    才把完整汇总重写一次并清空增量文件。
+    """
+
+    def __init__(self, log, directory, name="consumption"):
+        self.sub = Subscriber(log, name)
+        self.path = os.path.join(directory, f"{name}.json")
+        self.delta_path = os.path.join(directory, f"{name}.delta.jsonl")
+        self.lock = threading.Lock()
+        self.daily = {}   # 表 → 日期 → ID → 消耗量
+        self.weekly = {}  # 表 → 周一日期 → ID → 消耗量
+        self._totals = {}  # (表, 窗口天数) → (起始日期, {ID: 窗口内消耗量})，随新事件累加
+        self._rates = {}  # 查询结果缓存，对应的表有新事件时清掉
+        self._delta_lines = 0
+        self._pruned_on = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def _add(store, table, key, pid, q):
+        parts = store.setdefault(table, {}).setdefault(key, {})
+        parts[pid] = parts.get(pid, 0) + q
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+            self.sub.offset = state['offset']
+            for t, pid, day, q in state['daily']:
+                self._add(self.daily, t, day, pid, q)
+            for t, pid, week, q in state['weekly']:
+                self._add(self.weekly, t, week, pid, q)
+        except (OSError, ValueError):
+            pass
+        try:
+            with open(self.delta_path, encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                delta = json.loads(line)
+            except ValueError:  # 写到一半崩溃的行：马上压缩掉，之后的事件会从日志里重新消费
+                self._compact()
+                return
+            self._delta_lines += 1
+            if delta['offset'] <= self.sub.offset:  # 已经合并进完整汇总 (压缩中途崩溃)
+                continue
+            for t, pid, day, q in delta['daily']:
+                self._add(self.daily, t, day, pid, q)
+            for t, pid, week, q in delta['weekly']:
+                self._add(self.weekly, t, week, pid, q)
+            self.sub.offset = delta['offset']
+
+    def _compact(self):
+        """写出完整汇总 (先写临时文件再替换)，再清空增量文件"""
+        state = {
+            'offset': self.sub.offset,
+            'daily': [[t, pid, day, q] for t, days in self.daily.items()
+                      for day, parts in days.items() for pid, q in parts.items()],
+            'weekly': [[t, pid, week, q] for t, weeks in self.weekly.items()
+                       for week, parts in weeks.items() for pid, q in parts.items()],
+        }
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        open(self.delta_path, 'w').close()
+        self._delta_lines = 0
+
+    def _append_delta(self, daily, weekly):
+        line = json.dumps({'offset': self.sub.offset, 'daily': daily, 'weekly': weekly}, ensure_ascii=False)
+        with open(self.delta_path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+        self._delta_lines += 1
+
+    def refresh(self, max_events=10000):
+        """消费新事件并更新汇总，返回处理的事件数"""
+        with self.lock:
+            count = 0
+            daily, weekly = {}, {}  # 本次的增量，(表, ID, 日期) → 消耗量
+            while True:
+                batch = self.sub.poll(max_events)
+                if not batch:
+                    break
+                for _, e in batch:
+                    if e.kind in CONSUMING_KINDS and e.delta < 0:
+                        day = e.ts[:10]
+                        for delta, key in ((daily, day), (weekly, _week_of(day))):
+                            k = (e.table, e.part_id, key)
+                            delta[k] = delta.get(k, 0) - e.delta
+                count += len(batch)
+                self.sub.offset = batch[-1][0]
+            if count:
+                for (t, pid, day), q in daily.items():
+                    self._add(self.daily, t, day, pid, q)
+                    for (table, _), (cut, sums) in self._totals.items():
+                        if table == t and day >= cut:
+                            sums[pid] = sums.get(pid, 0) + q
+                for (t, pid, week), q in weekly.items():
+                    self._add(self.weekly, t, week, pid, q)
+                if self._pruned_on != date.today() or self._delta_lines + 1 >= COMPACT_EVERY:
+                    self._prune()
+                    self._compact()
+                else:
+                    self._append_delta([[*k, q] for k, q in daily.items()],
+                                       [[*k, q] for k, q in weekly.items()])
+                self.sub.commit(self.sub.offset)
+                touched = {k[0] for k in daily} | {k[0] for k in weekly}
+                self._rates = {k: v for k, v in self._rates.items() if k[1] not in touched}
+            return count
+
+    def _prune(self):
+        today = date.today()
+        day_cut = (today - timedelta(days=DAILY_RETENTION)).isoformat()
+        week_cut = (today - timedelta(weeks=WEEKLY_RETENTION)).isoformat()
+        for store, cut in ((self.daily, day_cut), (self.weekly, week_cut)):
+            for days in store.values():
+                for key in [k for k in days if k < cut]:
+                    del days[key]
+        self._pruned_on = today
+
+    def daily_rate(self, table, window_days=28):
+        """最近 window_days 天的日均消耗，返回以 ID 为索引的 Series
+
+        窗口内的累计量随新事件增量更新，只在跨天 (窗口起点移动) 时按天重算一次。
+        """
+        key = ('rate', table, window_days, date.today())
+        with self.lock:
+            if key not in self._rates:
+                cut = (date.today() - timedelta(days=window_days - 1)).isoformat()
+                cached = self._totals.get((table, window_days))
+                if cached is None or cached[0] != cut:
+                    sums = {}
+                    for day, parts in self.daily.get(table, {}).items():
+                        if day >= cut:
+                            for pid, q in parts.items():
+                                sums[pid] = sums.get(pid, 0) + q
+                    cached = self._totals[(table, window_days)] = (cut, sums)
+                self._rates[key] = pd.Series(cached[1], dtype=float) / window_days
+            return self._rates[key]
+
+    def weekly_history(self, table, weeks=8):
+        """最近 weeks 周的每周消耗 (ID → 从旧到新的列表)，给表格里的迷你趋势图用"""
+        key = ('weekly', table, weeks, date.today())
+        with self.lock:
+            if key not in self._rates:
+                monday = date.today() - timedelta(days=date.today().weekday())
+                cols = [(monday - timedelta(weeks=i)).isoformat() for i in range(weeks - 1, -1, -1)]
+                by_week = self.weekly.get(table, {})
+                hist = {}
+                for i, week in enumerate(cols):
+                    for pid, q in by_week.get(week, {}).items():
+                        hist.setdefault(pid, [0] * weeks)[i] += q
+                self._rates[key] = hist
+            return self._rates[key]
+
+
+def forecast(df, rate, lead_days=7, cover_days=30, low=0):
+    """整表向量化计算 可用天数 与 建议补货量
+
+    目标库存 = 日均消耗 × (到货周期 + 希望覆盖的天数)，且不低于静态阈值 low；
+    建议补货量 = 目标库存 - 当前数量 (向上取整，不为负)。没有消耗记录的零件可用天数为无穷大。
+    """
+    qty = df['数量'].to_numpy(dtype=float)
+    daily = df[ID_COL].map(rate).fillna(0.0).to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cover = np.where(daily > 0, qty / daily, np.inf)
+    target = np.maximum(daily * (lead_days + cover_days), low)
+    suggest = np.ceil(np.clip(target - qty, 0, None)).astype(int)
+    out = df.copy()
+    out['日均消耗'] = np.round(daily, 2)
+    out['可用天数'] = np.round(cover, 1)
+    out['建议补货'] = suggest
+    out['状态'] = np.select(
+        [cover < lead_days, suggest > 0],
+        ["🔴 到货前会断货", "🟡 需补货"],
+        "🟢 充足",
+    )
+    return out.sort_values(['可用天数', '建议补货'], ascending=[True, False])
@@ -0,0 +1,238 @@
+"""报表与数据导出
+
+所有导出都是 "数据源 → 报表 → 写出" 的生成器流水线，逐行处理，不复制整张表：
+    数据源:  iter_frame(df)        已在内存中的 DataFrame (itertuples，不拷贝)
+             iter_xlsx(path)       xlsx 文件 (openpyxl 只读模式逐行读取)
+    报表:    full_dump / reorder_report / stocktake_report
+    写出:    csv / xlsx (write_only 模式) / jsonl
+
+脚本用法:
+    python exporter.py my_inventory.xlsx --report reorder --threshold 10 --format csv -o 补货.csv
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import pickle
+import sys
+import tempfile
+from datetime import date
+
+from openpyxl import Workbook, load_workbook
+
+REPORTS = {'full': "全量导出", 'reorder': "补货清单", 'stocktake': "盘点表"}
+FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'jsonl': 'application/jsonl',
+}
+
+
+# ==================== 📥 数据源 ====================
+
+def iter_frame(df):
+    """DataFrame → (表头, 行迭代器)，逐行生成 tuple，不复制数据"""
+    return list(df.columns), df.itertuples(index=False, name=None)
+
+
+def iter_xlsx(path):
+    """xlsx 第一个工作表 → (表头, 行迭代器)，只读模式下内存占用与文件大小无关"""
+    wb = load_workbook(path, read_only=True, data_only=True)
+    rows = wb.worksheets[0].iter_rows(values_only=True)
+    header = [str(h).strip() if h is not None else '' for h in next(rows, ())]
+
+    def gen():
+        try:
+            for row in rows:
+                if any(v is not None for v in row):
+                    yield row
+        finally:
+            wb.close()
+    return header, gen()
+
+
+def _qty(v):
+    try:
+        return int(float(v))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _text(v):
+    return '' if v is None or str(v) == 'nan' else str(v).strip()
+
+
+# ==================== 📑 报表 ====================
+# 报表 = (表头, 迭代器[(工作表名, 行)])。csv / jsonl 忽略工作表名，xlsx 按它分 sheet。
+
+def full_dump(header, rows, name="库存"):
+    """原样导出全部行"""
+    return header, ((name, row) for row in rows)
+
+
+def reorder_report(header, rows, threshold, group_by=('类型', '位置')):
+    """库存低于阈值的行，按 类型/位置 分组排列，并给出缺口数量
+
+    只有低库存的行会暂存在内存里 (分组需要)，其余行读过即丢。
+    """
+    q = header.index('数量')
+    keys = [header.index(c) for c in group_by if c in header]
+    out_header = [header[k] for k in keys] + [h for i, h in enumerate(header) if i not in keys] + ['缺口']
+
+    def gen():
+        groups = {}
+        for row in rows:
+            qty = _qty(row[q])
+            if qty < threshold:
+                key = tuple(_text(row[k]) for k in keys)
+                rest = [row[i] for i in range(len(header)) if i not in keys]
+                groups.setdefault(key, []).append(list(key) + rest + [threshold - qty])
+        for key in sorted(groups):
+            for row in groups[key]:
+                yield "补货清单", row
+    return out_header, gen()
+
+
+def stocktake_report(header, rows, location_col='位置', grouped=True):
+    """盘点表：位置列放最前，末尾加空白的 "实盘数量" 列
+
+    grouped=True 时按位置分组输出 (未分配位置的放最后)：每个位置的行先顺序写进各自的临时文件，
+    读完后按位置依次读回，内存占用与行数无关。xlsx 本身就按位置分 sheet，用 grouped=False 按原顺序直接流过。
+    """
+    loc = header.index(location_col) if location_col in header else None
+    rest = [i for i in range(len(header)) if i != loc]
+    out_header = [location_col] + [header[i] for i in rest] + ['实盘数量']
+
+    def stream():
+        for row in rows:
+            place = _text(row[loc]) if loc is not None else ''
+            yield place, [place] + [row[i] for i in rest] + [None]
+
+    def spilled():
+        spills = {}  # 位置 → 临时文件
+        try:
+            for place, row in stream():
+                fp = spills.get(place)
+                if fp is None:
+                    fp = spills[place] = tempfile.TemporaryFile()
+                pickle.dump(row, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            for place in sorted(spills, key=lambda p: (p == '', p)):
+                fp = spills[place]
+                fp.seek(0)
+                while True:
+                    try:
+                        row = pickle.load(fp)
+                    except EOFError:
+                        break
+                    yield place or "未分配", row
+        finally:
+            for fp in spills.values():
+                fp.close()
+
+    def direct():
+        for place, row in stream():
+            yield place or "未分配", row
+    return out_header, spilled() if grouped else direct()
+
+
+def build_report(kind, header, rows, threshold=10, name="库存", fmt=None):
+    """fmt 为目标格式：xlsx 的盘点表按位置分 sheet，不需要先分组"""
+    if kind == 'reorder':
+        return reorder_report(header, rows, threshold)
+    if kind == 'stocktake':
+        return stocktake_report(header, rows, grouped=fmt != 'xlsx')
+    return full_dump(header, rows, name)
+
+
+# ==================== 💾 写出 ====================
+
+def _plain(v):
+    """numpy 标量 → Python 标量，方便 json / openpyxl 处理"""
+    return v.item() if hasattr(v, 'item') else v
+
+
+def write_csv(report, fp):
+    header, rows = report
+    text = io.TextIOWrapper(fp, encoding='utf-8-sig', newline='')  # 带 BOM，Excel 打开中文不乱码
+    writer = csv.writer(text)
+    writer.writerow(header)
+    for _, row in rows:
+        writer.writerow(row)
+    text.flush()
+    text.detach()
+
+
+def write_jsonl(report, fp):
+    header, rows = report
+    for _, row in rows:
+        line = json.dumps({h: _plain(v) for h, v in zip(header, row)}, ensure_ascii=False, default=str)
+        fp.write(line.encode('utf-8') + b'\n')
+
+
+def _sheet_title(name, used):
+    title = ''.join('_' if c in '[]:*?/\\' else c for c in str(name))[:31] or "Sheet"
+    base, n = title, 1
+    while title in used:
+        n += 1
+        title = f"{base[:28]}_{n}"
+    return title
+
+
+def write_xlsx(report, fp):
+    header, rows = report
+    wb = Workbook(write_only=True)
+    sheets = {}
+    for name, row in rows:
+        ws = sheets.get(name)
+        if ws is None:
+            ws = wb.create_sheet(_sheet_title(name, {s.title for s in sheets.values()}))
+            ws.append(header)
+            sheets[name] = ws
+        ws.append([_plain(v) for v in row])
+    if not sheets:
+        wb.create_sheet("Sheet").append(header)
+    wb.save(fp)
+
+
+WRITERS = {'csv': write_csv, 'xlsx': write_xlsx, 'jsonl': write_jsonl}
+
+
+def export(report, fmt, fp):
+    """把报表写到二进制文件对象 fp"""
+    WRITERS[fmt](report, fp)
+
+
+def export_to_tempfile(report, fmt):
+    """写到临时文件并返回已回到开头的文件对象 (给 st.download_button 用)"""
+    fp = tempfile.TemporaryFile()
+    export(report, fmt, fp)
+    fp.seek(0)
+    return fp
+
+
+def export_filename(table, kind, fmt):
+    return f"{table}_{REPORTS[kind]}_{date.today():%Y%m%d}.{fmt}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="库存报表导出 (流式处理，适合大表)")
+    parser.add_argument('source', help="库存 xlsx 文件")
+    parser.add_argument('--report', choices=list(REPORTS), default='full')
+    parser.add_argument('--format', choices=list(FORMATS), default='csv')
+    parser.add_argument('--threshold', type=int, default=10, help="补货阈值 (低于此数量进入补货清单)")
+    parser.add_argument('-o', '--output', help="输出文件，省略时写到标准输出")
+    args = parser.parse_args()
+
+    header, rows = iter_xlsx(args.source)
+    name = os.path.splitext(os.path.basename(args.source))[0]
+    report = build_report(args.report, header, rows, args.threshold, name, args.format)
+    if args.output:
+        with open(args.output, 'wb') as fp:
+            export(report, args.format, fp)
+    else:
+        export(report, args.format, sys.stdout.buffer)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,28 +2,46 @@ import streamlit as st
 import pandas as pd
 import os
 import re
-import time
-import base64
+import json
+import getpass
+
+from row_ids import ID_COL, ensure_ids, build_index, apply_editor_delta, has_changes
+from exporter import REPORTS, FORMATS, iter_xlsx, build_report, export_to_tempfile, export_filename
+from stock_events import EventLog, StockEvent, diff_events, part_label, INBOUND, OUTBOUND, BOM_DEDUCT, MANUAL_EDIT
+from snapshot import SnapshotStore, source_mtime
+from param_index import ParamIndex, UNIT_FAMILIES, parse_si
+from consumption import ConsumptionRollup, forecast
+from upload_cache import MATCHES, read_upload, bom_rows, content_hash
+from bg_assets import BackgroundStore, background_css
 
 # ==================== 🎨 界面美化配置 ====================
 st.set_page_config(page_title="实验室库存管家 Pro", page_icon="🔬", layout="wide")
 
 
 # --- 核心函数：设置背景图 ---
-def set_background(image_file, opacity):
-    with open(image_file, "rb") as f:
-        img_data = f.read()
-    b64_encoded = base64.b64encode(img_data).decode()
-    style = f"""
-        <style>
-        .stApp {{
-            background-image: linear-gradient(rgba(243, 244, 246, {opacity}), rgba(243, 244, 246, {opacity})), url(data:image/png;base64,{b64_encoded});
-            background-size: cover;
-            background-position: center;
-            background-attachment: fixed;
-        }}
-        </style>
-    """
+# 开启 server.enableStaticServing 时背景图走静态文件，页面里只剩一小段样式
+# (run.py 与 .streamlit/config.toml 都已开启)；没开时退回内联的小图
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+
+@st.cache_resource
+def get_backgrounds(directory):
+    """进程内共享的背景图存储 (见 bg_assets.py)"""
+    return BackgroundStore(directory)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def background_style(image_path, opacity, url=None):
+    """按 (图片, 遮罩浓度) 缓存生成好的样式；图片文件名就是内容哈希，rerun 时不再重新编码"""
+    return background_css(image_path, opacity, url)
+
+
+def set_background(store, digest, opacity):
+    if st.get_option("server.enableStaticServing"):
+        name = store.publish_static(digest, STATIC_DIR)
+        style = background_style(None, opacity, f"app/static/{name}")
+    else:
+        style = background_style(store.inline_path(digest), opacity)
     st.markdown(style, unsafe_allow_html=True)
 
 
@@ -60,18 +78,69 @@ def local_css():
 local_css()
 
 # ==================== ⚙️ 配置区域 ====================
-BASE_DIR = r'D:\OneDrive\元器件库'
+# 可通过环境变量 INVENTORY_BASE_DIR 指定其它目录 (压测脚本用它指向临时目录)
+BASE_DIR = os.environ.get('INVENTORY_BASE_DIR', r'D:\OneDrive\元器件库')
 
 INVENTORY_FILE = os.path.join(BASE_DIR, 'my_inventory.xlsx')
 SCREW_FILE = os.path.join(BASE_DIR, 'my_screws.xlsx')
+# 处理过的背景图 (按内容哈希存放)；BG_CACHE_FILE 是旧版本留下的原图，首次启动时导入一次
+ASSET_DIR = os.path.join(BASE_DIR, '.assets')
 BG_CACHE_FILE = os.path.join(BASE_DIR, 'bg_image.png')
+# 多进程共享的表快照 (见 snapshot.py)
+SNAPSHOT_DIR = os.path.join(BASE_DIR, '.snapshot')
+
+# 各表的列
+E_COLS = ['名称', '参数', '类型', '封装', '数量', '位置', '备注']
+S_COLS = ['规格', '类型', '长度', '材质', '数量', '备注']
+
+# 低库存阈值 (仪表盘与补货报表共用)
+ELEC_LOW = 10
+SCREW_LOW = 20
 
 if not os.path.exists(BASE_DIR):
     os.makedirs(BASE_DIR, exist_ok=True)
 
+# 库存变动事件日志 (下游按偏移量增量消费，见 stock_events.py)
+EVENT_DIR = os.path.join(BASE_DIR, 'events')
+EVENT_LOG = EventLog(EVENT_DIR)
+APP_USER = getpass.getuser()
+
 
 # ==================== 🔧 通用核心函数 ====================
 
+@st.cache_resource
+def get_snapshot(directory):
+    """进程内共享的快照存储，已映射的表在所有会话间复用"""
+    return SnapshotStore(directory)
+
+
+@st.cache_resource
+def get_param_index(directory):
+    """进程内共享的 参数 数值索引，随快照版本增量更新"""
+    return ParamIndex()
+
+
+@st.cache_resource
+def get_rollup(event_dir):
+    """进程内共享的消耗汇总，从事件日志增量更新"""
+    return ConsumptionRollup(EventLog(event_dir), os.path.join(event_dir, 'rollup'))
+
+
+def snapshot_name(file_path):
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def publish_snapshot(df, file_path, mtime=None):
+    """xlsx 写好后发布新快照；失败时其他进程退回到解析 xlsx，不影响保存
+
+    mtime 是 df 对应的 xlsx 修改时间，应在写完 (或读之前) 立即取，不能等到发布时再读。
+    """
+    try:
+        return get_snapshot(SNAPSHOT_DIR).publish(snapshot_name(file_path), df, file_path, mtime)
+    except Exception as e:
+        st.warning(f"快照发布失败: {e}")
+        return None
+
 def get_sort_value(name):
     name = str(name).upper().strip()
     match = re.search(r'(\d+\.?\d*)\s*([KMGUNPμR]?)', name)
@@ -90,7 +159,7 @@ def get_sort_value(name):
 
 def load_excel(file_path, columns):
     if not os.path.exists(file_path):
-        df = pd.DataFrame(columns=columns)
+        df = pd.DataFrame(columns=[ID_COL] + columns)
         df.to_excel(file_path, index=False)
         return df
     else:
@@ -103,25 +172,86 @@ def load_excel(file_path, columns):
                 if col != '数量':
                     df[col] = df[col].astype(str).replace('nan', '').str.strip()
             df['数量'] = pd.to_numeric(df['数量'], errors='coerce').fillna(0).astype(int)
+            # 老文件没有 ID 列时，分配后立即写回，保证 ID 稳定
+            if ensure_ids(df):
+                save_excel(df, file_path)
             return df
         except Exception as e:
             st.error(f"读取文件失败: {e}")
-            return pd.DataFrame(columns=columns)
+            return pd.DataFrame(columns=[ID_COL] + columns)
 
 
 def save_excel(df, file_path):
     try:
+        ensure_ids(df)
         save_df = df.copy()
         for hidden in ['sort_key', '数值权重']:
             if hidden in save_df.columns:
                 save_df = save_df.drop(columns=[hidden])
         save_df.to_excel(file_path, index=False)
+        mtime = source_mtime(file_path)
+        publish_snapshot(save_df, file_path, mtime)
         return True
     except PermissionError:
         st.error(f"⚠️ 保存失败！请关闭 '{os.path.basename(file_path)}'。")
         return False
 
 
+def sync_table(key, file_path, columns):
+    """会话里的表换成最新快照：每次 rerun 只比较版本号，版本变了才重新映射
+
+    没有可用快照 (第一次运行或 xlsx 被外部修改过) 时解析 xlsx 并发布，其他进程直接映射。
+    """
+    snap = get_snapshot(SNAPSHOT_DIR)
+    name = snapshot_name(file_path)
+    version = snap.version(name, file_path)
+    if key in st.session_state and version is not None and st.session_state.get(key + '_ver') == version:
+        return st.session_state[key]
+    version, df = snap.get(name, file_path)
+    if df is None:
+        mtime = source_mtime(file_path)  # 读之前取：读的过程中被改过时快照作废，下次重新解析
+        df = load_excel(file_path, columns)
+        version = snap.version(name, file_path)  # 补 ID 写回时已经发布过
+        if version is None and not df.empty:  # 读取失败返回的空表不发布
+            version = publish_snapshot(df, file_path, mtime)
+    st.session_state[key] = df
+    st.session_state[key + '_ver'] = version
+    return df
+
+
+def row_index(key):
+    """会话表的 ID → 行 字典：表和快照版本都没变时复用，不在每次 rerun 时重建"""
+    df, version = st.session_state[key], st.session_state.get(key + '_ver')
+    cached = st.session_state.get(key + '_rows')
+    if version is not None and cached and cached[0] is df and cached[1] == version:
+        return cached[2]
+    row_of = build_index(df)
+    st.session_state[key + '_rows'] = (df, version, row_of)
+    return row_of
+
+
+def record_events(events):
+    """记录库存变动事件；日志写失败只提示，不影响已保存的库存"""
+    try:
+        EVENT_LOG.append(events)
+    except OSError as e:
+        st.warning(f"事件日志写入失败: {e}")
+
+
+def deduct_bom(curr, valid):
+    """按 ID 执行 BOM 扣减 (原地修改 curr)，返回对应的事件；已删除或库存已不足的行跳过"""
+    row_of = build_index(curr)
+    events = []
+    for a in valid:
+        if a['id'] not in row_of: continue
+        idx = row_of[a['id']]
+        if curr.at[idx, '数量'] < a['qty']: continue
+        curr.at[idx, '数量'] -= a['qty']
+        events.append(StockEvent(BOM_DEDUCT, 'electronics', a['id'], -a['qty'], int(curr.at[idx, '数量']),
+                                 part_label(curr.loc[idx]), APP_USER, app='inventory_app'))
+    return events
+
+
 def get_default_index(options, keywords):
     for idx, opt in enumerate(options):
         for kw in keywords:
@@ -129,366 +259,516 @@ def get_default_index(options, keywords):
     return 0
 
 
-# ==================== 📱 系统 1: 电子元器件 ====================
-def render_electronics_app():
-    st.markdown("## 📱 电子元器件控制台")
-    E_COLS = ['名称', '参数', '类型', '封装', '数量', '位置', '备注']
-    if 'df_elec' not in st.session_state:
-        st.session_state.df_elec = load_excel(INVENTORY_FILE, E_COLS)
-    df = st.session_state.df_elec
+# ==================== 🧩 局部刷新 ====================
+# 页面拆成几个 st.fragment：在某个片段里输入、筛选、选择时只重跑这个片段，
+# 不再重画侧边栏、背景、仪表盘和整张表格。
+# 片段之间不会自动同步，真正改动了库存时调用 data_changed() 整页重跑一次。
 
-    # --- 仪表盘 ---
+def data_changed():
+    """库存已写入：整页重跑一次，让仪表盘和其他片段拿到新数据"""
+    st.rerun(scope="app")
+
+
+def pending_delta(key):
+    """编辑器里尚未保存的增量及其签名 (没有时为 None, None)
+
+    保存成功后调用方把签名记到 key + '_saved'，整页重跑时同一份增量不会再保存一次；
+    保存失败 (例如文件被 Excel 占用) 不记签名，下次重跑会再试。
+    """
+    delta = st.session_state.get(key)
+    if not has_changes(delta):
+        st.session_state.pop(key + '_saved', None)
+        return None, None
+    sig = json.dumps(delta, sort_keys=True, default=str)
+    if st.session_state.get(key + '_saved') == sig:
+        return None, None
+    return delta, sig
+
+
+# ==================== 📱 系统 1: 电子元器件 ====================
+@st.fragment
+def elec_kpis():
+    df = sync_table('df_elec', INVENTORY_FILE, E_COLS)
     total_items = len(df)
     total_qty = df['数量'].sum()
-    low_stock = df[df['数量'] < 10]
+    low_stock = df[df['数量'] < ELEC_LOW]
     low_stock_count = len(low_stock)
 
     kpi1, kpi2, kpi3 = st.columns(3)
     kpi1.metric("📦 器件种类", f"{total_items}", delta="SKU")
     kpi2.metric("🔢 库存总数", f"{total_qty}", delta="PCS")
-    kpi3.metric("⚠️ 低库存 (<10)", f"{low_stock_count}", delta="需补货", delta_color="inverse")
+    kpi3.metric(f"⚠️ 低库存 (<{ELEC_LOW})", f"{low_stock_count}", delta="需补货", delta_color="inverse")
 
     if low_stock_count > 0:
         with st.expander(f"🔴 查看 {low_stock_count} 个库存紧张的器件", expanded=False):
             # 修复警告：use_container_width -> width='stretch'
             st.dataframe(low_stock[['名称', '参数', '数量', '位置']], width='stretch')
 
-    st.markdown("---")
-
-    tab1, tab2, tab3 = st.tabs(["📊 库存总览", "📥 详细入库", "📤 BOM出库"])
 
-    with tab1:
-        c1, c2 = st.columns([1.5, 5])
-        with c1:
-            st.markdown("##### 🛠 筛选与排序")
-            sort_mode = st.selectbox(
-                "🔃 排序方式",
-                ["智能排序 (类型>名称>参数)", "按库存 (从多到少)", "按库存 (从少到多)", "最近入库 (倒序)"]
-            )
+@st.fragment
+def elec_overview():
+    """筛选面板和表格放在同一个片段：表格依赖筛选条件，拆开的话筛选一次还得整页重跑"""
+    df = sync_table('df_elec', INVENTORY_FILE, E_COLS)
+    c1, c2 = st.columns([1.5, 5])
+    with c1:
+        st.markdown("##### 🛠 筛选与排序")
+        sort_mode = st.selectbox(
+            "🔃 排序方式",
+            ["智能排序 (类型>名称>参数)", "按库存 (从多到少)", "按库存 (从少到多)", "最近入库 (倒序)"]
+        )
 
-            existing_types = list(df['类型'].unique())
-            existing_pkgs = list(df['封装'].unique())
+        existing_types = list(df['类型'].unique())
+        existing_pkgs = list(df['封装'].unique())
+
+        filter_type = st.multiselect("按类型", [x for x in existing_types if x])
+        filter_pkg = st.multiselect("按封装", [x for x in existing_pkgs if x])
+
+        # 参数范围：按单位族建有序索引，二分查找，不扫全表
+        p_index = get_param_index(SNAPSHOT_DIR)
+        p_index.sync(df, st.session_state.get('df_elec_ver'))
+        families = p_index.families()
+        p_family = st.selectbox("🎚️ 参数单位", [None] + [f for f in UNIT_FAMILIES if f in families],
+                                format_func=lambda f: "(不限)" if f is None else UNIT_FAMILIES[f])
+        pc1, pc2 = st.columns(2)
+        p_min_txt = pc1.text_input("最小值", placeholder="4.7k", disabled=p_family is None)
+        p_max_txt = pc2.text_input("最大值", placeholder="22k", disabled=p_family is None)
+        try:
+            p_min, p_max = parse_si(p_min_txt), parse_si(p_max_txt)
+        except ValueError as e:
+            st.caption(f"⚠️ {e}，支持 4.7k / 100n / 1M 这类写法")
+            p_min = p_max = None
 
-            filter_type = st.multiselect("按类型", [x for x in existing_types if x])
-            filter_pkg = st.multiselect("按封装", [x for x in existing_pkgs if x])
-            search_txt = st.text_input("🔍 搜索", placeholder="输入型号/参数...")
+        search_txt = st.text_input("🔍 搜索", placeholder="输入型号/参数...")
 
-            st.write("")
-            # 修复警告：use_container_width -> width='stretch'
-            if st.button("🔄 刷新全表", use_container_width=True):
-                st.session_state.df_elec = load_excel(INVENTORY_FILE, E_COLS)
-                st.rerun()
+        st.write("")
+        # 修复警告：use_container_width -> width='stretch'
+        if st.button("🔄 刷新全表", use_container_width=True):
+            st.session_state.pop('df_elec', None)
+            data_changed()
 
-        with c2:
+    with c2:
+        if p_family is not None:
+            # 索引给出的 ID 经 ID → 行 字典直接取行；字典按快照版本缓存
+            row_of = row_index('df_elec')
+            display_df = df.loc[[row_of[i] for i in p_index.range(p_family, p_min, p_max) if i in row_of]]
+        else:
             display_df = df.copy()
-            if filter_type: display_df = display_df[display_df['类型'].isin(filter_type)]
-            if filter_pkg: display_df = display_df[display_df['封装'].isin(filter_pkg)]
-            if search_txt:
-                mask = display_df.astype(str).apply(lambda x: x.str.contains(search_txt, case=False)).any(axis=1)
-                display_df = display_df[mask]
-
-            if sort_mode == "智能排序 (类型>名称>参数)":
-                display_df['数值权重'] = display_df['参数'].apply(get_sort_value)
-                display_df = display_df.sort_values(by=['类型', '名称', '数值权重'], ascending=[True, True, True])
-            elif sort_mode == "按库存 (从多到少)":
-                display_df = display_df.sort_values(by=['数量'], ascending=False)
-            elif sort_mode == "按库存 (从少到多)":
-                display_df = display_df.sort_values(by=['数量'], ascending=True)
-            elif sort_mode == "最近入库 (倒序)":
-                display_df = display_df.sort_index(ascending=False)
-
-            final_df = display_df[E_COLS].copy()
-            final_df.index = range(1, len(final_df) + 1)
+        if filter_type: display_df = display_df[display_df['类型'].isin(filter_type)]
+        if filter_pkg: display_df = display_df[display_df['封装'].isin(filter_pkg)]
+        if search_txt:
+            mask = display_df.astype(str).apply(lambda x: x.str.contains(search_txt, case=False)).any(axis=1)
+            display_df = display_df[mask]
+
+        if sort_mode == "智能排序 (类型>名称>参数)":
+            display_df['数值权重'] = display_df['参数'].apply(get_sort_value)
+            display_df = display_df.sort_values(by=['类型', '名称', '数值权重'], ascending=[True, True, True])
+        elif sort_mode == "按库存 (从多到少)":
+            display_df = display_df.sort_values(by=['数量'], ascending=False)
+        elif sort_mode == "按库存 (从少到多)":
+            display_df = display_df.sort_values(by=['数量'], ascending=True)
+        elif sort_mode == "最近入库 (倒序)":
+            display_df = display_df.sort_index(ascending=False)
 
-            # 修复警告：use_container_width -> width='stretch'
-            edited_df = st.data_editor(
-                final_df,
-                column_config={
-                    "名称": st.column_config.TextColumn("名称", width="medium", required=True),
-                    "参数": st.column_config.TextColumn("参数", width="medium"),
-                    "类型": st.column_config.TextColumn("分类", width="small"),
-                    "封装": st.column_config.TextColumn("封装", width="small"),
-                    "数量": st.column_config.NumberColumn("库存", format="%d"),
-                    "位置": st.column_config.TextColumn("📍 位置", width="small"),
-                    "备注": st.column_config.TextColumn("备注", width="medium"),
-                },
-                width='stretch', num_rows="dynamic", hide_index=False, key="elec_editor", height=500
-            )
+        final_df = display_df[[ID_COL] + E_COLS].copy()
+        final_df.index = range(1, len(final_df) + 1)
 
-            if not final_df.reset_index(drop=True).equals(edited_df.reset_index(drop=True)):
-                if save_excel(edited_df, INVENTORY_FILE):
-                    st.session_state.df_elec = edited_df.reset_index(drop=True)
-                    st.toast("已保存更改", icon="💾")
+        # 修复警告：use_container_width -> width='stretch'
+        st.data_editor(
+            final_df,
+            column_config={
+                "名称": st.column_config.TextColumn("名称", width="medium", required=True),
+                "参数": st.column_config.TextColumn("参数", width="medium"),
+                "类型": st.column_config.TextColumn("分类", width="small"),
+                "封装": st.column_config.TextColumn("封装", width="small"),
+                "数量": st.column_config.NumberColumn("库存", format="%d"),
+                "位置": st.column_config.TextColumn("📍 位置", width="small"),
+                "备注": st.column_config.TextColumn("备注", width="medium"),
+                ID_COL: None,
+            },
+            width='stretch', num_rows="dynamic", hide_index=False, key="elec_editor", height=500
+        )
 
-    with tab2:
-        c_up, c_info = st.columns([1, 1])
-        with c_up:
-            up_in = st.file_uploader("📂 拖拽上传入库单 (Excel)", type=['xlsx', 'xls'], key="e_in")
-        with c_info:
-            st.info("💡 提示：Excel 导入支持自定义类型。")
-        if up_in:
-            df_new = pd.read_excel(up_in)
-            cols = list(df_new.columns)
-            cc1, cc2, cc3, cc4, cc5 = st.columns(5)
-            c_name = cc1.selectbox("名称", cols, index=get_default_index(cols, ['名称', 'Name']))
-            c_param = cc2.selectbox("参数", ["(无)"] + cols, index=get_default_index(cols, ['参数', '值', 'Value']))
-            c_qty = cc3.selectbox("数量", cols, index=get_default_index(cols, ['数量', 'Qty']))
-            c_pkg = cc4.selectbox("封装", ["(无)"] + cols, index=get_default_index(cols, ['封装']))
-            c_type = cc5.selectbox("类型", ["(无)"] + cols, index=get_default_index(cols, ['类型']))
-            if st.button("🚀 开始入库", type="primary"):
-                curr = load_excel(INVENTORY_FILE, E_COLS)
-                cnt = 0
-                for _, row in df_new.iterrows():
-                    name = str(row[c_name]).strip()
-                    if not name or name == 'nan': continue
-                    try:
-                        qty = int(row[c_qty])
-                    except:
-                        qty = 0
-                    param = str(row[c_param]).strip() if c_param != "(无)" and str(row[c_param]) != 'nan' else ""
-                    pkg = str(row[c_pkg]).strip() if c_pkg != "(无)" and str(row[c_pkg]) != 'nan' else ""
-                    typ = str(row[c_type]).strip() if c_type != "(无)" and str(row[c_type]) != 'nan' else ""
-                    mask = (curr['名称'] == name)
-                    if param: mask = mask & (curr['参数'] == param)
-                    if pkg: mask = mask & (curr['封装'] == pkg)
-                    if mask.any():
-                        idx = curr[mask].index[0]
-                        curr.at[idx, '数量'] += qty
-                        if typ and not curr.at[idx, '类型']: curr.at[idx, '类型'] = typ
-                    else:
-                        new_row = pd.DataFrame(
-                            {'名称': [name], '参数': [param], '类型': [typ], '封装': [pkg], '数量': [qty], '位置': [''],
-                             '备注': ['']})
-                        curr = pd.concat([curr, new_row], ignore_index=True)
-                    cnt += 1
-                save_excel(curr, INVENTORY_FILE)
+        # 按 ID 把编辑增量合并回全表，筛选/排序状态下编辑也不会丢行
+        delta, sig = pending_delta("elec_editor")
+        if delta:
+            new_df = apply_editor_delta(df, final_df, delta).reset_index(drop=True)
+            if save_excel(new_df, INVENTORY_FILE):
+                st.session_state.elec_editor_saved = sig
+                record_events(diff_events(df, new_df, 'electronics', MANUAL_EDIT, APP_USER, 'inventory_app'))
+                st.session_state.df_elec = new_df
+                st.toast("已保存更改", icon="💾")
+                data_changed()
+
+
+@st.fragment
+def elec_inbound():
+    c_up, c_info = st.columns([1, 1])
+    with c_up:
+        up_in = st.file_uploader("📂 拖拽上传入库单 (Excel)", type=['xlsx', 'xls'], key="e_in")
+    with c_info:
+        st.info("💡 提示：Excel 导入支持自定义类型。")
+    if up_in:
+        _, df_new = read_upload(up_in)
+        cols = list(df_new.columns)
+        cc1, cc2, cc3, cc4, cc5 = st.columns(5)
+        c_name = cc1.selectbox("名称", cols, index=get_default_index(cols, ['名称', 'Name']))
+        c_param = cc2.selectbox("参数", ["(无)"] + cols, index=get_default_index(cols, ['参数', '值', 'Value']))
+        c_qty = cc3.selectbox("数量", cols, index=get_default_index(cols, ['数量', 'Qty']))
+        c_pkg = cc4.selectbox("封装", ["(无)"] + cols, index=get_default_index(cols, ['封装']))
+        c_type = cc5.selectbox("类型", ["(无)"] + cols, index=get_default_index(cols, ['类型']))
+        if st.button("🚀 开始入库", type="primary"):
+            curr = sync_table('df_elec', INVENTORY_FILE, E_COLS).copy()
+            before = curr.copy()
+            cnt = 0
+            for _, row in df_new.iterrows():
+                name = str(row[c_name]).strip()
+                if not name or name == 'nan': continue
+                try:
+                    qty = int(row[c_qty])
+                except:
+                    qty = 0
+                param = str(row[c_param]).strip() if c_param != "(无)" and str(row[c_param]) != 'nan' else ""
+                pkg = str(row[c_pkg]).strip() if c_pkg != "(无)" and str(row[c_pkg]) != 'nan' else ""
+                typ = str(row[c_type]).strip() if c_type != "(无)" and str(row[c_type]) != 'nan' else ""
+                mask = (curr['名称'] == name)
+                if param: mask = mask & (curr['参数'] == param)
+                if pkg: mask = mask & (curr['封装'] == pkg)
+                if mask.any():
+                    idx = curr[mask].index[0]
+                    curr.at[idx, '数量'] += qty
+                    if typ and not curr.at[idx, '类型']: curr.at[idx, '类型'] = typ
+                else:
+                    new_row = pd.DataFrame(
+                        {'名称': [name], '参数': [param], '类型': [typ], '封装': [pkg], '数量': [qty], '位置': [''],
+                         '备注': ['']})
+                    curr = pd.concat([curr, new_row], ignore_index=True)
+                cnt += 1
+            # 保存失败 (文件被 Excel 占用) 时不记事件、不替换表，报错留在页面上
+            if save_excel(curr, INVENTORY_FILE):
+                record_events(diff_events(before, curr, 'electronics', INBOUND, APP_USER, 'inventory_app'))
                 st.session_state.df_elec = curr
-                st.balloons()
-                st.success(f"成功入库 {cnt} 条数据！")
-                time.sleep(1)
-                st.rerun()
-
-    with tab3:
-        st.markdown("#### 📤 智能 BOM 扣减")
-        up_out = st.file_uploader("📂 上传 BOM 清单", type=['xlsx', 'xls'], key="e_out")
-        if up_out and st.session_state.get('last_bom_name') != up_out.name:
-            st.session_state.last_bom_name = up_out.name
-            st.session_state.bom_res = None
-        if up_out:
-            df_bom = pd.read_excel(up_out)
-            cols = list(df_bom.columns)
-            c1, c2, c3, c4 = st.columns(4)
-            t_name = c1.selectbox("BOM名称", cols, index=get_default_index(cols, ['名称', 'Model']))
-            t_param = c2.selectbox("BOM参数", ["(无)"] + cols, index=get_default_index(cols, ['参数', '值', 'Value']))
-            t_qty = c3.selectbox("BOM数量", cols, index=get_default_index(cols, ['数量', 'Qty']))
-            t_pkg = c4.selectbox("BOM封装", ["(无)"] + cols, index=get_default_index(cols, ['封装']))
-            # 修复警告：use_container_width -> width='stretch'
-            if st.button("🔍 检查库存匹配", use_container_width=True):
-                temp = st.session_state.df_elec.copy()
-                valid, missing = [], []
-                for _, row in df_bom.iterrows():
-                    name = str(row[t_name]).strip()
-                    if not name or "无货" in name: continue
-                    try:
-                        q = int(row[t_qty])
-                    except:
-                        q = 1
-                    bparam = str(row[t_param]).strip() if t_param != "(无)" and str(row[t_param]) != 'nan' else ""
-                    bpkg = str(row[t_pkg]).strip() if t_pkg != "(无)" and str(row[t_pkg]) != 'nan' else ""
-                    mask = temp['名称'] == name
-                    if bparam: mask = mask & (temp['参数'] == bparam)
-                    if bpkg: mask = mask & (temp['封装'] == bpkg)
-                    if mask.any():
-                        idx = temp[mask].index[0]
-                        curr_q = temp.at[idx, '数量']
-                        if curr_q >= q:
-                            valid.append({'index': idx, 'qty': q})
-                        else:
-                            missing.append(f"❌ 不足: {name} {bparam} (需{q}, 存{curr_q})")
+                st.toast(f"成功入库 {cnt} 条数据！", icon="🎉")
+                data_changed()
+
+
+@st.fragment
+def elec_bom():
+    st.markdown("#### 📤 智能 BOM 扣减")
+    up_out = st.file_uploader("📂 上传 BOM 清单", type=['xlsx', 'xls'], key="e_out")
+    if up_out:
+        # 按文件内容哈希缓存：调整列映射时不再重新解析，同名的新文件也不会拿到旧结果
+        bom_hash, df_bom = read_upload(up_out)
+        cols = list(df_bom.columns)
+        c1, c2, c3, c4 = st.columns(4)
+        t_name = c1.selectbox("BOM名称", cols, index=get_default_index(cols, ['名称', 'Model']))
+        t_param = c2.selectbox("BOM参数", ["(无)"] + cols, index=get_default_index(cols, ['参数', '值', 'Value']))
+        t_qty = c3.selectbox("BOM数量", cols, index=get_default_index(cols, ['数量', 'Qty']))
+        t_pkg = c4.selectbox("BOM封装", ["(无)"] + cols, index=get_default_index(cols, ['封装']))
+        mapping = (t_name, t_param, t_qty, t_pkg)
+        # 匹配结果还取决于当前库存：先同步到最新版本再取版本号，
+        # 库存变了 (扣减、入库、别处修改) 旧结果自动失效，片段单独重跑时也一样
+        temp = sync_table('df_elec', INVENTORY_FILE, E_COLS)
+        match_key = (bom_hash, mapping, st.session_state.get('df_elec_ver'))
+        res = MATCHES.get(match_key)
+        # 修复警告：use_container_width -> width='stretch'
+        if st.button("🔍 检查库存匹配", use_container_width=True):
+            valid, missing = [], []
+            for b in bom_rows(bom_hash, df_bom, mapping):
+                mask = temp['名称'] == b['name']
+                if b['param']: mask = mask & (temp['参数'] == b['param'])
+                if b['pkg']: mask = mask & (temp['封装'] == b['pkg'])
+                if mask.any():
+                    idx = temp[mask].index[0]
+                    curr_q = temp.at[idx, '数量']
+                    if curr_q >= b['qty']:
+                        valid.append({'id': temp.at[idx, ID_COL], 'qty': b['qty']})
                     else:
-                        missing.append(f"❓ 未找到: {name} {bparam}")
-                st.session_state.bom_res = {'valid': valid, 'missing': missing}
-            if st.session_state.get('bom_res'):
-                res = st.session_state.bom_res
-                if not res['missing']:
-                    st.success("✅ 完美匹配！")
-                    if st.button("🚀 立即执行扣减", type="primary"):
-                        curr = st.session_state.df_elec.copy()
-                        for a in res['valid']: curr.at[a['index'], '数量'] -= a['qty']
-                        save_excel(curr, INVENTORY_FILE)
-                        st.session_state.df_elec = curr
-                        st.session_state.bom_res = None
-                        st.balloons()
-                        st.rerun()
+                        missing.append(f"❌ 不足: {b['name']} {b['param']} (需{b['qty']}, 存{curr_q})")
                 else:
-                    st.error(f"发现 {len(res['missing'])} 个问题")
-                    # 修复警告：use_container_width -> width='stretch'
-                    st.dataframe(res['missing'], width='stretch')
-                    if res['valid'] and st.button(f"⚠️ 强行扣减匹配的 {len(res['valid'])} 项", type="secondary"):
-                        curr = st.session_state.df_elec.copy()
-                        for a in res['valid']: curr.at[a['index'], '数量'] -= a['qty']
-                        save_excel(curr, INVENTORY_FILE)
-                        st.session_state.df_elec = curr
-                        st.session_state.bom_res = None
-                        st.balloons()
-                        st.rerun()
+                    missing.append(f"❓ 未找到: {b['name']} {b['param']}")
+            res = MATCHES.put(match_key, {'valid': valid, 'missing': missing})
+        if res:
+            if not res['missing']:
+                st.success("✅ 完美匹配！")
+                if st.button("🚀 立即执行扣减", type="primary"):
+                    apply_bom(res['valid'], match_key)
+            else:
+                st.error(f"发现 {len(res['missing'])} 个问题")
+                # 修复警告：use_container_width -> width='stretch'
+                st.dataframe(res['missing'], width='stretch')
+                if res['valid'] and st.button(f"⚠️ 强行扣减匹配的 {len(res['valid'])} 项", type="secondary"):
+                    apply_bom(res['valid'], match_key)
 
 
-# ==================== 🔩 系统 2: 螺丝/五金 ====================
-def render_screws_app():
-    st.markdown("## 🔩 五金件控制台")
-    S_COLS = ['规格', '类型', '长度', '材质', '数量', '备注']
+def apply_bom(valid, match_key):
+    curr = sync_table('df_elec', INVENTORY_FILE, E_COLS).copy()
+    events = deduct_bom(curr, valid)
+    if not save_excel(curr, INVENTORY_FILE):
+        return
+    record_events(events)
+    st.session_state.df_elec = curr
+    MATCHES.pop(match_key)  # 防止快照版本没变时同一结果被再扣一次
+    skipped = len(valid) - len(events)
+    st.toast(f"已扣减 {len(events)} 项" + (f"，{skipped} 项库存已变化未扣" if skipped else ""), icon="📤")
+    data_changed()
+
+
+def render_electronics_app():
+    st.markdown("## 📱 电子元器件控制台")
+    elec_kpis()
+    st.markdown("---")
 
-    if 'df_screw' not in st.session_state:
-        st.session_state.df_screw = load_excel(SCREW_FILE, S_COLS)
-    df = st.session_state.df_screw
+    tab1, tab2, tab3 = st.tabs(["📊 库存总览", "📥 详细入库", "📤 BOM出库"])
+    with tab1:
+        elec_overview()
+    with tab2:
+        elec_inbound()
+    with tab3:
+        elec_bom()
 
+
+# ==================== 🔩 系统 2: 螺丝/五金 ====================
+@st.fragment
+def screw_kpis():
+    df = sync_table('df_screw', SCREW_FILE, S_COLS)
     total_items = len(df)
     total_qty = df['数量'].sum()
-    low_stock = df[df['数量'] < 20]
+    low_stock = df[df['数量'] < SCREW_LOW]
     low_stock_count = len(low_stock)
 
     kpi1, kpi2, kpi3 = st.columns(3)
     kpi1.metric("📦 五金种类", f"{total_items}", delta="SKU")
     kpi2.metric("🔢 库存总数", f"{total_qty}", delta="PCS")
-    kpi3.metric("⚠️ 低库存 (<20)", f"{low_stock_count}", delta="需补货", delta_color="inverse")
+    kpi3.metric(f"⚠️ 低库存 (<{SCREW_LOW})", f"{low_stock_count}", delta="需补货", delta_color="inverse")
 
     if low_stock_count > 0:
         with st.expander(f"🔴 查看 {low_stock_count} 个库存紧张的五金件"):
             # 修复警告：use_container_width -> width='stretch'
             st.dataframe(low_stock[['规格', '长度', '类型', '数量']], width='stretch')
 
-    st.markdown("---")
-
-    c1, c2 = st.columns([2, 5])
-
-    with c1:
-        st.markdown("### ⚡ 快速操作")
-        # 修复警告：use_container_width -> width='stretch'
-        if st.button("🔄 刷新数据", use_container_width=True):
-            st.session_state.df_screw = load_excel(SCREW_FILE, S_COLS)
-            st.rerun()
 
-        st.write("")
-
-        op_tab1, op_tab2 = st.tabs(["🟢 入库 (加)", "🔴 出库 (拿)"])
-        with op_tab1:
-            with st.container(border=True):
-                q_spec = st.text_input("规格", placeholder="如 M3", key="qs1")
-                col_l, col_t = st.columns(2)
-                q_len = col_l.text_input("长度", placeholder="10mm", key="qs2")
-                q_type = col_t.text_input("头型/种类", placeholder="如: 圆头", key="qs3")
-                q_qty = st.number_input("数量", min_value=1, value=50, step=10, key="qs4")
-                # 修复警告：use_container_width -> width='stretch'
-                if st.button("➕ 确认入库", use_container_width=True, type="primary"):
-                    if q_spec:
-                        mask = (df['规格'] == q_spec) & (df['长度'] == q_len) & (df['类型'] == q_type)
-                        if mask.any():
-                            df.loc[mask, '数量'] += q_qty
-                            st.toast(f"库存已累加: {q_spec} +{q_qty}", icon="✅")
-                        else:
-                            new_row = pd.DataFrame({
-                                '规格': [q_spec], '类型': [q_type], '长度': [q_len],
-                                '材质': ['不锈钢'], '数量': [q_qty], '备注': ['']
-                            })
-                            df = pd.concat([df, new_row], ignore_index=True)
-                            st.toast(f"新规格入库: {q_spec}", icon="✨")
-                        save_excel(df, SCREW_FILE)
+@st.fragment
+def screw_quick_ops():
+    df = sync_table('df_screw', SCREW_FILE, S_COLS)
+    st.markdown("### ⚡ 快速操作")
+    # 修复警告：use_container_width -> width='stretch'
+    if st.button("🔄 刷新数据", use_container_width=True):
+        st.session_state.pop('df_screw', None)
+        data_changed()
+
+    st.write("")
+
+    op_tab1, op_tab2 = st.tabs(["🟢 入库 (加)", "🔴 出库 (拿)"])
+    with op_tab1:
+        with st.container(border=True):
+            q_spec = st.text_input("规格", placeholder="如 M3", key="qs1")
+            col_l, col_t = st.columns(2)
+            q_len = col_l.text_input("长度", placeholder="10mm", key="qs2")
+            q_type = col_t.text_input("头型/种类", placeholder="如: 圆头", key="qs3")
+            q_qty = st.number_input("数量", min_value=1, value=50, step=10, key="qs4")
+            # 修复警告：use_container_width -> width='stretch'
+            if st.button("➕ 确认入库", use_container_width=True, type="primary"):
+                if q_spec:
+                    before, df = df, df.copy()  # 在副本上改，保存失败时会话里的表保持原样
+                    mask = (df['规格'] == q_spec) & (df['长度'] == q_len) & (df['类型'] == q_type)
+                    if mask.any():
+                        df.loc[mask, '数量'] += q_qty
+                        msg, icon = f"库存已累加: {q_spec} +{q_qty}", "✅"
+                    else:
+                        new_row = pd.DataFrame({
+                            '规格': [q_spec], '类型': [q_type], '长度': [q_len],
+                            '材质': ['不锈钢'], '数量': [q_qty], '备注': ['']
+                        })
+                        df = pd.concat([df, new_row], ignore_index=True)
+                        msg, icon = f"新规格入库: {q_spec}", "✨"
+                    if save_excel(df, SCREW_FILE):
+                        record_events(diff_events(before, df, 'screws', INBOUND, APP_USER, 'inventory_app'))
                         st.session_state.df_screw = df
-                        time.sleep(0.5)
-                        st.rerun()
-
-        with op_tab2:
-            with st.container(border=True):
-                if df.empty:
-                    st.warning("暂无库存，无法出库")
+                        st.toast(msg, icon=icon)
+                        data_changed()
+
+    with op_tab2:
+        with st.container(border=True):
+            if df.empty:
+                st.warning("暂无库存，无法出库")
+            else:
+                row_of = build_index(df)
+                in_stock = df.loc[df['数量'] > 0, ID_COL].tolist()
+                if not in_stock:
+                    st.info("库存全部为 0，无法出库")
                 else:
-                    item_map = {
-                        f"{row['规格']} - {row['长度']} - {row['类型']} (余:{row['数量']})": i
-                        for i, row in df.iterrows() if row['数量'] > 0
-                    }
-                    if not item_map:
-                        st.info("库存全部为 0，无法出库")
-                    else:
-                        selected_label = st.selectbox("选择物料", list(item_map.keys()), key="out_sel")
-                        take_qty = st.number_input("拿取数量", min_value=1, value=1, key="out_qty")
-                        # 修复警告：use_container_width -> width='stretch'
-                        if st.button("➖ 确认出库", use_container_width=True):
-                            idx = item_map[selected_label]
-                            current_qty = df.at[idx, '数量']
-                            if current_qty >= take_qty:
-                                df.at[idx, '数量'] -= take_qty
-                                save_excel(df, SCREW_FILE)
+                    selected_id = st.selectbox(
+                        "选择物料", in_stock, key="out_sel",
+                        format_func=lambda i: "{} - {} - {} (余:{})".format(
+                            *df.loc[row_of[i], ['规格', '长度', '类型', '数量']])
+                    )
+                    take_qty = st.number_input("拿取数量", min_value=1, value=1, key="out_qty")
+                    # 修复警告：use_container_width -> width='stretch'
+                    if st.button("➖ 确认出库", use_container_width=True):
+                        idx = row_of[selected_id]
+                        current_qty = df.at[idx, '数量']
+                        if current_qty >= take_qty:
+                            df = df.copy()
+                            df.at[idx, '数量'] -= take_qty
+                            if save_excel(df, SCREW_FILE):
+                                record_events([StockEvent(
+                                    OUTBOUND, 'screws', selected_id, -take_qty, int(df.at[idx, '数量']),
+                                    part_label(df.loc[idx]), APP_USER, app='inventory_app')])
                                 st.session_state.df_screw = df
                                 st.toast(f"已出库 {take_qty} 个", icon="📉")
-                                time.sleep(0.5)
-                                st.rerun()
-                            else:
-                                st.error(f"库存不足！当前只有 {current_qty} 个")
+                                data_changed()
+                        else:
+                            st.error(f"库存不足！当前只有 {current_qty} 个")
+
+
+@st.fragment
+def screw_table():
+    df = sync_table('df_screw', SCREW_FILE, S_COLS)
+    st.markdown("### 📋 五金清单")
+    c_sort_s, c_ph_s = st.columns([1, 2])
+    with c_sort_s:
+        sort_mode_s = st.selectbox(
+            "🔃 排序方式",
+            ["智能排序 (规格>长度)", "按库存 (从多到少)", "按库存 (从少到多)"],
+            key="sort_screw"
+        )
 
+    display_df = df.copy()
+    if sort_mode_s == "智能排序 (规格>长度)":
+        display_df = display_df.sort_values(by=['规格', '长度'])
+    elif sort_mode_s == "按库存 (从多到少)":
+        display_df = display_df.sort_values(by=['数量'], ascending=False)
+    elif sort_mode_s == "按库存 (从少到多)":
+        display_df = display_df.sort_values(by=['数量'], ascending=True)
+
+    display_df.index = range(1, len(display_df) + 1)
+
+    # 修复警告：use_container_width -> width='stretch'
+    st.data_editor(
+        display_df,
+        column_config={
+            "规格": st.column_config.TextColumn("规格", required=True),
+            "类型": st.column_config.TextColumn("头型/种类", width="small"),
+            "长度": st.column_config.TextColumn("长度"),
+            "材质": st.column_config.TextColumn("材质"),
+            "数量": st.column_config.NumberColumn("库存", format="%d"),
+            ID_COL: None,
+        },
+        width='stretch', num_rows="dynamic", hide_index=False, height=500, key="screw_editor"
+    )
+
+    delta, sig = pending_delta("screw_editor")
+    if delta:
+        new_df = apply_editor_delta(df, display_df, delta).reset_index(drop=True)
+        if save_excel(new_df, SCREW_FILE):
+            st.session_state.screw_editor_saved = sig
+            record_events(diff_events(df, new_df, 'screws', MANUAL_EDIT, APP_USER, 'inventory_app'))
+            st.session_state.df_screw = new_df
+            st.toast("五金库存已保存", icon="💾")
+            data_changed()
+
+
+def render_screws_app():
+    st.markdown("## 🔩 五金件控制台")
+    screw_kpis()
+    st.markdown("---")
+
+    c1, c2 = st.columns([2, 5])
+    with c1:
+        screw_quick_ops()
     with c2:
-        st.markdown("### 📋 五金清单")
-        c_sort_s, c_ph_s = st.columns([1, 2])
-        with c_sort_s:
-            sort_mode_s = st.selectbox(
-                "🔃 排序方式",
-                ["智能排序 (规格>长度)", "按库存 (从多到少)", "按库存 (从少到多)"],
-                key="sort_screw"
-            )
+        screw_table()
 
-        display_df = df.copy()
-        if sort_mode_s == "智能排序 (规格>长度)":
-            display_df = display_df.sort_values(by=['规格', '长度'])
-        elif sort_mode_s == "按库存 (从多到少)":
-            display_df = display_df.sort_values(by=['数量'], ascending=False)
-        elif sort_mode_s == "按库存 (从少到多)":
-            display_df = display_df.sort_values(by=['数量'], ascending=True)
 
-        display_df.index = range(1, len(display_df) + 1)
+# ==================== 📈 系统 3: 补货建议 ====================
+@st.fragment
+def render_reorder_app():
+    st.markdown("## 📈 补货建议")
+    st.caption("按最近的实际消耗 (出库、BOM 扣减、手动改小) 估算还能用几天，以及要补多少才够用")
 
-        # 修复警告：use_container_width -> width='stretch'
-        edited_df = st.data_editor(
-            display_df,
-            column_config={
-                "规格": st.column_config.TextColumn("规格", required=True),
-                "类型": st.column_config.TextColumn("头型/种类", width="small"),
-                "长度": st.column_config.TextColumn("长度"),
-                "材质": st.column_config.TextColumn("材质"),
-                "数量": st.column_config.NumberColumn("库存", format="%d"),
-            },
-            width='stretch', num_rows="dynamic", hide_index=False, height=500, key="screw_editor"
-        )
+    rollup = get_rollup(EVENT_DIR)
+    rollup.refresh()
 
-        if not display_df.reset_index(drop=True).equals(edited_df.reset_index(drop=True)):
-            if save_excel(edited_df, SCREW_FILE):
-                st.session_state.df_screw = edited_df.reset_index(drop=True)
-                st.toast("五金库存已保存", icon="💾")
+    c1, c2, c3, c4 = st.columns(4)
+    table = c1.selectbox("仓库", ["电子元器件", "螺丝/五金"])
+    window = c2.selectbox("按最近多少天计算", [7, 14, 28, 56, 90], index=2, format_func=lambda d: f"{d} 天")
+    lead_days = c3.number_input("到货周期 (天)", value=7, min_value=1, max_value=180)
+    cover_days = c4.number_input("补货后够用 (天)", value=30, min_value=1, max_value=365)
+
+    if table == "电子元器件":
+        df = sync_table('df_elec', INVENTORY_FILE, E_COLS)
+        name, low, show_cols = 'electronics', ELEC_LOW, ['名称', '参数', '封装', '位置']
+    else:
+        df = sync_table('df_screw', SCREW_FILE, S_COLS)
+        name, low, show_cols = 'screws', SCREW_LOW, ['规格', '长度', '类型']
+
+    plan = forecast(df, rollup.daily_rate(name, window), lead_days, cover_days, low)
+    need = plan[plan['建议补货'] > 0]
+
+    kpi1, kpi2, kpi3 = st.columns(3)
+    kpi1.metric("🔴 到货前会断货", f"{(plan['可用天数'] < lead_days).sum()}")
+    kpi2.metric("🛒 需要补货", f"{len(need)}")
+    kpi3.metric("📉 有消耗记录", f"{(plan['日均消耗'] > 0).sum()}")
+
+    only_need = st.toggle("只看需要补货的", value=True)
+    view = need if only_need else plan
+    hist = rollup.weekly_history(name)
+    view = view[[ID_COL, '状态'] + show_cols + ['数量', '日均消耗', '可用天数', '建议补货']].copy()
+    view['近8周消耗'] = [hist.get(i, [0] * 8) for i in view[ID_COL]]
+    st.dataframe(
+        view, hide_index=True, width='stretch', height=600,
+        column_config={
+            ID_COL: None,
+            "可用天数": st.column_config.NumberColumn("可用天数", format="%.1f", help="∞ 表示最近没有消耗"),
+            "近8周消耗": st.column_config.BarChartColumn("近8周消耗", y_min=0),
+        }
+    )
 
 
 # ==================== 🚀 侧边栏导航与设置 ====================
 with st.sidebar:
     st.markdown("### 🧰 实验室管家")
     st.markdown("---")
-    app_mode = st.radio("工作区:", ["📱 电子元器件", "🔩 螺丝/五金"], index=0, label_visibility="collapsed")
+    app_mode = st.radio("工作区:", ["📱 电子元器件", "🔩 螺丝/五金", "📈 补货建议"], index=0,
+                        label_visibility="collapsed")
     st.markdown("---")
     st.info(f"📂 **当前仓库:**\n{os.path.basename(BASE_DIR)}")
 
     st.markdown("### 🎨 个性化设置")
+    bg_store = get_backgrounds(ASSET_DIR)
     bg_img_file = st.file_uploader("上传背景图", type=['png', 'jpg', 'jpeg'], key='bg_uploader')
-    saved_bg_path = None
-    if os.path.exists(BG_CACHE_FILE): saved_bg_path = BG_CACHE_FILE
-    current_bg = None
-    if bg_img_file:
-        with open(BG_CACHE_FILE, "wb") as f:
-            f.write(bg_img_file.getbuffer())
-        current_bg = BG_CACHE_FILE
-    elif saved_bg_path:
-        current_bg = saved_bg_path
+    try:
+        if bg_img_file:
+            # 只有换了图才缩小、压缩、落盘；同一张图留在上传框里时每次 rerun 只比较哈希
+            bg_digest = content_hash(bg_img_file)
+            if bg_digest != bg_store.current():
+                bg_store.set_current(bg_store.add(bg_digest, bg_img_file.getvalue()))
+        elif bg_store.current() is None and os.path.exists(BG_CACHE_FILE):
+            bg_store.set_current(bg_store.add_file(BG_CACHE_FILE))
+    except OSError as e:
+        st.error(f"背景图无法读取: {e}")
     bg_opacity = st.slider("背景遮罩浓度", 0.0, 1.0, 0.85)
-    if current_bg: set_background(current_bg, bg_opacity)
+    current_bg = bg_store.current()
+    if current_bg: set_background(bg_store, current_bg, bg_opacity)
+
+    # 导出直接从磁盘上的 xlsx 流式读取，点击下载时才生成
+    with st.expander("📤 报表导出"):
+        ex_table = st.selectbox("数据", ["电子元器件", "螺丝五金"], key="ex_table")
+        ex_kind = st.selectbox("报表", list(REPORTS), format_func=REPORTS.get, key="ex_kind")
+        ex_fmt = st.selectbox("格式", list(FORMATS), key="ex_fmt")
+        ex_path, ex_low = (INVENTORY_FILE, ELEC_LOW) if ex_table == "电子元器件" else (SCREW_FILE, SCREW_LOW)
+        if os.path.exists(ex_path):
+            st.download_button(
+                "⬇️ 生成并下载",
+                data=lambda: export_to_tempfile(build_report(ex_kind, *iter_xlsx(ex_path), ex_low, ex_table, ex_fmt), ex_fmt),
+                file_name=export_filename(ex_table, ex_kind, ex_fmt), mime=FORMATS[ex_fmt],
+                use_container_width=True
+            )
     st.caption("v2.6 Pro | 排序修复版")
 
 if app_mode == "📱 电子元器件":
     render_electronics_app()
 elif app_mode == "🔩 螺丝/五金":
-    render_screws_app()
\ No newline at end of file
+    render_screws_app()
+elif app_mode == "📈 补货建议":
+    render_reorder_app()
\ No newline at end of file
@@ -0,0 +1,479 @@
+"""离线多会话压测脚本
+
+用 Streamlit 的 AppTest 无界面地驱动真实的 streamlit_app.py / inventory_app.py，
+模拟多个实验室用户交替进行 搜索 / 排序 / 入库 / 出库 / 表格编辑保存。
+
+- 云端版：用内存里的假 GSheetsConnection 代替 Google Sheets，可设置读写延迟
+- 本地版：在临时目录里生成 xlsx，通过 INVENTORY_BASE_DIR 指给 inventory_app
+
+结束后输出：单次 rerun 延迟分位数、吞吐量、每个会话的内存、丢失更新数。
+全程不需要联网。
+
+用法:
+    python load_test.py --app cloud --sessions 20 --steps 400 --read-latency 0.05
+    python load_test.py --app excel --sessions 20 --steps 400
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+
+import pandas as pd
+
+import write_scheduler
+from row_ids import ID_COL, ensure_ids
+from stock_events import EventLog
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# ==================== ☁️ 假的 Google Sheets 后端 ====================
+
+class FakeSheetsStore:
+    """内存中的工作表存储，读写都按配置的延迟 sleep，模拟网络往返"""
+
+    def __init__(self, sheets, read_latency=0.05, write_latency=0.1):
+        self.sheets = {name: df.copy() for name, df in sheets.items()}
+        self.read_latency = read_latency
+        self.write_latency = write_latency
+        self.reads = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+
+    def read(self, worksheet):
+        time.sleep(self.read_latency)
+        with self.lock:
+            self.reads += 1
+            return self.sheets[worksheet].copy()
+
+    def update(self, worksheet, data):
+        time.sleep(self.write_latency)
+        with self.lock:
+            self.writes += 1
+            self.sheets[worksheet] = data.copy()
+
+
+# 记录每一次交给写入调度器的修改，用于判断异步写入最终是否成功
+_TICKETS = []
+_original_submit = write_scheduler.WriteScheduler.submit
+
+
+def _recording_submit(self, sheet, mutation, on_commit=None):
+    fut = _original_submit(self, sheet, mutation, on_commit)
+    _TICKETS.append(fut)
+    return fut
+
+
+write_scheduler.WriteScheduler.submit = _recording_submit
+
+
+def install_fake_gsheets(store):
+    """把假的 streamlit_gsheets 模块放进 sys.modules，streamlit_app 导入时拿到的就是它"""
+    from streamlit.connections import BaseConnection
+
+    class GSheetsConnection(BaseConnection):
+        def _connect(self, **kwargs):
+            return store
+
+        def read(self, worksheet=None, ttl=None, **kwargs):
+            return store.read(worksheet)
+
+        def update(self, worksheet=None, data=None, **kwargs):
+            store.update(worksheet, data)
+
+    module = types.ModuleType('streamlit_gsheets')
+    module.GSheetsConnection = GSheetsConnection
+    sys.modules['streamlit_gsheets'] = module
+
+
+# ==================== 🧪 测试数据 ====================
+
+def make_seed(rows, rng):
+    """生成三张表的初始数据，每个 (规格, 长度, 类型) / (名称, 尺寸) 都唯一"""
+    units = ['R', 'K', 'M', 'nF', 'uF', 'pF']
+    elec = pd.DataFrame({
+        '名称': [f"{rng.choice(['电阻', '电容', '芯片'])}-{i}" for i in range(rows)],
+        '参数': [f"{rng.choice([1, 2.2, 4.7, 10, 22, 47, 100])}{rng.choice(units)}" for _ in range(rows)],
+        '类型': [rng.choice(['电阻', '电容', 'IC', '二极管']) for _ in range(rows)],
+        '封装': [rng.choice(['0402', '0603', '0805', 'SOT-23']) for _ in range(rows)],
+        '数量': [rng.randint(0, 500) for _ in range(rows)],
+        '位置': [f"{rng.choice('ABCD')}-{rng.randint(1, 20):02d}" for _ in range(rows)],
+        '备注': [''] * rows,
+    })
+    screws = pd.DataFrame({
+        '规格': [f"M{2 + i % 6}" for i in range(rows)],
+        '类型': [f"头型{i // 6}" for i in range(rows)],
+        '长度': [f"{4 + i % 8 * 2}mm" for i in range(rows)],
+        '材质': ['不锈钢'] * rows,
+        '数量': [rng.randint(0, 500) for _ in range(rows)],
+        '备注': [''] * rows,
+    })
+    pcbs = pd.DataFrame({
+        '名称': [f"V{i}.0 板" for i in range(max(rows // 5, 1))],
+        '尺寸': ['10x10cm'] * max(rows // 5, 1),
+        '数量': [rng.randint(0, 50) for _ in range(max(rows // 5, 1))],
+        '位置': ['A-01'] * max(rows // 5, 1),
+        '备注': [''] * max(rows // 5, 1),
+    })
+    for df in (elec, screws, pcbs):
+        ensure_ids(df)
+    return elec, screws, pcbs
+
+
+# ==================== 📒 预期结果账本 ====================
+
+class Ledger:
+    """按提交顺序重放所有被应用确认的数量变化，得到"没有并发问题时"应有的库存
+
+    异步写入的操作带着调度器的 Future，最终写入失败 (如库存不足被拒) 的不计入。
+    """
+
+    def __init__(self, frames):
+        self.initial = {name: dict(zip(df[ID_COL], df['数量'])) for name, df in frames.items()}
+        self.ops = []
+
+    def add(self, table, part_id, delta, tickets=()):
+        self.ops.append((table, part_id, 'add', delta, list(tickets)))
+
+    def set(self, table, part_id, qty, tickets=()):
+        self.ops.append((table, part_id, 'set', qty, list(tickets)))
+
+    def confirmed(self):
+        return [op for op in self.ops if all(not t.exception() for t in op[4])]
+
+    def expected(self, table):
+        qty = dict(self.initial[table])
+        for t, part_id, kind, value, _ in self.confirmed():
+            if t == table:
+                qty[part_id] = value if kind == 'set' else qty.get(part_id, 0) + value
+        return qty
+
+    def compare(self, table, df):
+        actual = dict(zip(df[ID_COL], pd.to_numeric(df['数量'], errors='coerce').fillna(0).astype(int)))
+        lost_parts, lost_qty = 0, 0
+        for part_id, qty in self.expected(table).items():
+            diff = actual.get(part_id, 0) - qty
+            if diff:
+                lost_parts += 1
+                lost_qty += abs(diff)
+        return lost_parts, lost_qty
+
+
+# ==================== 🤖 模拟会话 ====================
+
+def _by_label(widgets, label):
+    for w in widgets:
+        if w.label == label:
+            return w
+    raise LookupError(label)
+
+
+def _pick_option(box, candidates, rng):
+    """selectbox 里显示的是格式化后的文字，挑一个真正出现在选项里的行 ID"""
+    shown = set(box.options)
+    candidates = list(candidates)
+    rng.shuffle(candidates)
+    for part_id in candidates:
+        try:
+            if box.format_func(part_id) in shown:
+                return part_id
+        except KeyError:
+            continue
+    return None
+
+
+def _editor_state(at, key, delta, clicks=()):
+    """构造一次带 data_editor 增量的运行 (AppTest 没有直接编辑表格的接口)"""
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+    editor = next(d for d in at.dataframe if d.key == key)
+    for btn in clicks:
+        btn.click()
+    states = at._tree.get_widget_states()
+    states.widgets.append(WidgetState(id=editor.proto.id, string_value=json.dumps(delta)))
+    return states
+
+
+class Session:
+    def __init__(self, at, rng, ledger):
+        self.at = at
+        self.rng = rng
+        self.ledger = ledger
+        self.latencies = []
+        self.tickets = []
+
+    def run(self, states=None):
+        """执行一次 rerun，返回应用是否确认成功；异步写入的 Future 记在 self.tickets"""
+        n = len(_TICKETS)
+        start = time.perf_counter()
+        if states is None:
+            self.at.run()
+        else:
+            self.at._run(states)
+        self.latencies.append(time.perf_counter() - start)
+        self.tickets = _TICKETS[n:]
+        return not self.at.exception and not self.at.error
+
+    def edit_quantity(self, table, save_label=None):
+        """在电子元器件编辑器里改一行数量并保存，核对成功后记入账本
+
+        其他会话改过数据后，编辑器的数据变了、控件 ID 随之改变，在旧视图上构造的增量会被静默丢弃。
+        所以先 rerun 拿到最新视图再改；保存后按 ID 在刷新后的视图里核对数量，
+        对不上 (增量被丢弃、保存失败) 就不算确认。
+        """
+        self.run()
+        view = next(d for d in self.at.dataframe if d.key == "elec_editor").value
+        if view.empty:
+            return
+        pos = self.rng.randrange(len(view))
+        part_id = view.iloc[pos][ID_COL]
+        qty = self.rng.randint(0, 500)
+        clicks = [_by_label(self.at.button, save_label)] if save_label else []
+        states = _editor_state(self.at, "elec_editor", {'edited_rows': {str(pos): {'数量': qty}}}, clicks)
+        if not self.run(states):
+            return
+        after = next(d for d in self.at.dataframe if d.key == "elec_editor").value
+        saved = after.loc[after[ID_COL] == part_id, '数量']
+        if not saved.empty and int(saved.iloc[0]) == qty:
+            self.ledger.set(table, part_id, qty, self.tickets)
+
+    def switch(self, label):
+        radio = self.at.sidebar.radio[0]
+        if radio.value != label:
+            radio.set_value(label)
+            self.run()
+
+
+class CloudSession(Session):
+    """streamlit_app.py 的一个登录用户"""
+    ACTIONS = {'search': 3, 'sort': 2, 'inbound': 2, 'outbound': 3, 'editor_save': 1}
+
+    def search(self, store):
+        self.switch("电子元器件")
+        _by_label(self.at.text_input, "搜索...").set_value(self.rng.choice(['', '0603', 'K', 'nF', '电阻']))
+        self.run()
+
+    def sort(self, store):
+        self.switch("电子元器件")
+        _by_label(self.at.selectbox, "排序").set_value(self.rng.choice(["智能排序", "库存倒序", "库存正序"]))
+        self.run()
+
+    def inbound(self, store):
+        self.switch("五金螺丝")
+        row = store.sheets['screws'].sample(1, random_state=self.rng.randint(0, 10 ** 6)).iloc[0]
+        qty = self.rng.randint(1, 50)
+        _by_label(self.at.text_input, "规格").set_value(row['规格'])
+        _by_label(self.at.text_input, "长度").set_value(row['长度'])
+        _by_label(self.at.text_input, "类型").set_value(row['类型'])
+        _by_label(self.at.number_input, "数量").set_value(qty)
+        _by_label(self.at.button, "➕ 确认入库").click()
+        if self.run():
+            self.ledger.add('screws', row[ID_COL], qty, self.tickets)
+
+    def outbound(self, store):
+        table, mode, label = self.rng.choice([('screws', "五金螺丝", "选择螺丝"), ('pcbs', "PCB电路板", "选择板子")])
+        self.switch(mode)
+        box = _by_label(self.at.selectbox, label)
+        part_id = _pick_option(box, self.ledger.initial[table], self.rng)
+        if part_id is None:
+            return
+        qty = self.rng.randint(1, 5)
+        box.set_value(part_id)
+        _by_label(self.at.number_input, "领用数量").set_value(qty)
+        _by_label(self.at.button, "➖ 确认出库").click()
+        if self.run():
+            self.ledger.add(table, part_id, -qty, self.tickets)
+
+    def editor_save(self, store):
+        self.switch("电子元器件")
+        self.edit_quantity('electronics', "💾 保存更改到云端")
+
+
+class ExcelSession(Session):
+    """inventory_app.py 的一个浏览器标签页"""
+    ACTIONS = {'search': 3, 'sort': 2, 'inbound': 2, 'outbound': 3, 'editor_save': 1}
+
+    def search(self, store):
+        self.switch("📱 电子元器件")
+        _by_label(self.at.text_input, "🔍 搜索").set_value(self.rng.choice(['', '0603', 'K', 'nF', '电阻']))
+        self.run()
+
+    def sort(self, store):
+        self.switch("📱 电子元器件")
+        _by_label(self.at.selectbox, "🔃 排序方式").set_value(self.rng.choice(
+            ["智能排序 (类型>名称>参数)", "按库存 (从多到少)", "按库存 (从少到多)", "最近入库 (倒序)"]))
+        self.run()
+
+    def inbound(self, store):
+        self.switch("🔩 螺丝/五金")
+        row = store['screws'].sample(1, random_state=self.rng.randint(0, 10 ** 6)).iloc[0]
+        qty = self.rng.randint(1, 50)
+        self.at.text_input(key="qs1").set_value(row['规格'])
+        self.at.text_input(key="qs2").set_value(row['长度'])
+        self.at.text_input(key="qs3").set_value(row['类型'])
+        self.at.number_input(key="qs4").set_value(qty)
+        _by_label(self.at.button, "➕ 确认入库").click()
+        if self.run():
+            self.ledger.add('screws', row[ID_COL], qty, self.tickets)
+
+    def outbound(self, store):
+        self.switch("🔩 螺丝/五金")
+        try:
+            box = self.at.selectbox(key="out_sel")
+        except KeyError:
+            return
+        part_id = _pick_option(box, self.ledger.initial['screws'], self.rng)
+        if part_id is None:
+            return
+        qty = self.rng.randint(1, 5)
+        box.set_value(part_id)
+        self.at.number_input(key="out_qty").set_value(qty)
+        _by_label(self.at.button, "➖ 确认出库").click()
+        if self.run():
+            self.ledger.add('screws', part_id, -qty, self.tickets)
+
+    def editor_save(self, store):
+        self.switch("📱 电子元器件")
+        self.edit_quantity('electronics')
+
+
+# ==================== 🚀 主流程 ====================
+
+def _percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def run_load_test(app, sessions=20, steps=400, rows=300, read_latency=0.05, write_latency=0.1, seed=0):
+    """跑一轮压测，返回结果字典 (也可以在别的脚本里直接调用)"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    elec, screws, pcbs = make_seed(rows, rng)
+    tmp = tempfile.TemporaryDirectory()
+
+    if app == 'cloud':
+        # 写入调度器是 st.cache_resource，连续跑多轮时要清掉上一轮的实例
+        import streamlit as st
+        st.cache_resource.clear()
+        store = FakeSheetsStore({'electronics': elec, 'screws': screws, 'pcbs': pcbs}, read_latency, write_latency)
+        install_fake_gsheets(store)
+        os.environ['STOCK_EVENT_DIR'] = os.path.join(tmp.name, 'events')
+        os.environ['STOCK_SNAPSHOT_DIR'] = os.path.join(tmp.name, 'snapshot')
+        ledger = Ledger(store.sheets)
+        script, session_cls = os.path.join(APP_DIR, 'streamlit_app.py'), CloudSession
+    else:
+        os.environ['INVENTORY_BASE_DIR'] = tmp.name
+        elec.to_excel(os.path.join(tmp.name, 'my_inventory.xlsx'), index=False)
+        screws.to_excel(os.path.join(tmp.name, 'my_screws.xlsx'), index=False)
+        store = {'electronics': elec, 'screws': screws}
+        ledger = Ledger(store)
+        script, session_cls = os.path.join(APP_DIR, 'inventory_app.py'), ExcelSession
+
+    # --- 建立会话：只在这一段开 tracemalloc，避免影响后面的延迟测量 ---
+    tracemalloc.start()
+    mem_before = tracemalloc.get_traced_memory()[0]
+    users = []
+    for i in range(sessions):
+        at = AppTest.from_file(script, default_timeout=120)
+        if app == 'cloud':
+            at.session_state.logged_in = True
+            at.session_state.username = f"user{i}"
+        user = session_cls(at, random.Random(rng.random()), ledger)
+        user.run()
+        users.append(user)
+    mem_per_session = (tracemalloc.get_traced_memory()[0] - mem_before) / max(sessions, 1)
+    tracemalloc.stop()
+    for user in users:
+        user.latencies.clear()
+
+    # --- 交替执行动作：每一步随机挑一个会话，按权重挑一个动作 ---
+    names, weights = zip(*session_cls.ACTIONS.items())
+    counts = dict.fromkeys(names, 0)
+    failures = 0
+    start = time.perf_counter()
+    for _ in range(steps):
+        user = rng.choice(users)
+        action = rng.choices(names, weights)[0]
+        try:
+            getattr(user, action)(store)
+            counts[action] += 1
+        except Exception:
+            failures += 1
+    write_scheduler.drain_all(timeout=300)
+    elapsed = time.perf_counter() - start
+
+    # --- 与账本对比，统计丢失的更新 ---
+    if app == 'cloud':
+        final = store.sheets
+    else:
+        final = {'electronics': pd.read_excel(os.path.join(tmp.name, 'my_inventory.xlsx')),
+                 'screws': pd.read_excel(os.path.join(tmp.name, 'my_screws.xlsx'))}
+    lost = {table: ledger.compare(table, final[table]) for table in ledger.initial}
+    events = sum(1 for _ in EventLog(os.path.join(tmp.name, 'events')).read())
+    tmp.cleanup()
+
+    latencies = [x for user in users for x in user.latencies]
+    return {
+        'app': app,
+        'sessions': sessions,
+        'steps': steps,
+        'actions': counts,
+        'harness_failures': failures,
+        'reruns': len(latencies),
+        'elapsed_s': round(elapsed, 2),
+        'reruns_per_s': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'actions_per_s': round(sum(counts.values()) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {f"p{p}": round(_percentile(latencies, p) * 1000, 1) for p in (50, 90, 95, 99)},
+        'memory_per_session_kb': round(mem_per_session / 1024, 1),
+        'confirmed_ops': len(ledger.confirmed()),
+        'rejected_ops': len(ledger.ops) - len(ledger.confirmed()),
+        'lost_updates': {table: {'parts': parts, 'qty': qty} for table, (parts, qty) in lost.items()},
+        'events_logged': events,
+        'backend': {'reads': store.reads, 'writes': store.writes} if app == 'cloud' else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="库存管家离线多会话压测")
+    parser.add_argument('--app', choices=['cloud', 'excel', 'both'], default='both')
+    parser.add_argument('--sessions', type=int, default=20, help="模拟的用户数")
+    parser.add_argument('--steps', type=int, default=400, help="总动作数 (所有会话合计)")
+    parser.add_argument('--rows', type=int, default=300, help="每张表的初始行数")
+    parser.add_argument('--read-latency', type=float, default=0.05, help="假 Sheets 读延迟 (秒)")
+    parser.add_argument('--write-latency', type=float, default=0.1, help="假 Sheets 写延迟 (秒)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    apps = ['cloud', 'excel'] if args.app == 'both' else [args.app]
+    results = [run_load_test(app, args.sessions, args.steps, args.rows, args.read_latency,
+                             args.write_latency, args.seed) for app in apps]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    for r in results:
+        print(f"\n===== {r['app']} | {r['sessions']} 会话 | {r['steps']} 步 =====")
+        print(f"动作分布     : {r['actions']} (脚本异常 {r['harness_failures']})")
+        print(f"rerun 次数   : {r['reruns']} 用时 {r['elapsed_s']}s → {r['reruns_per_s']} rerun/s, "
+              f"{r['actions_per_s']} 动作/s")
+        print(f"rerun 延迟   : " + ", ".join(f"{k}={v}ms" for k, v in r['latency_ms'].items()))
+        print(f"内存/会话    : {r['memory_per_session_kb']} KB")
+        print(f"已确认操作   : {r['confirmed_ops']} (异步写入被拒 {r['rejected_ops']})")
+        print(f"丢失更新     : " + ", ".join(
+            f"{t}: {v['parts']} 个零件 / {v['qty']} 件" for t, v in r['lost_updates'].items()))
+        print(f"事件日志     : {r['events_logged']} 条")
+        if r['backend']:
+            print(f"后端调用     : {r['backend']['reads']} 读, {r['backend']['writes']} 写")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""参数 列的数值解析与有序索引
+
+把 "4K7"、"4.7kΩ"、"100nF"、"16V" 这类写法解析成 (单位族, 数值)，
+每个单位族维护一份按数值排序的列表，范围查询 ("0603 电阻 4.7K ~ 22K") 用二分查找，不扫全表。
+
+    index = ParamIndex()
+    index.sync(df, token=版本号)        # 只重新解析 参数 变化过的行
+    ids = index.range('Ω', parse_si('4.7k'), parse_si('22k'))
+"""
+import re
+import threading
+from bisect import bisect_left, bisect_right
+
+from row_ids import ID_COL
+
+# 单位族 → 显示名称 (顺序即界面中的顺序)，'' 为只有数字、没有单位的参数
+UNIT_FAMILIES = {
+    'Ω': "电阻 (Ω)",
+    'F': "电容 (F)",
+    'H': "电感 (H)",
+    'V': "电压 (V)",
+    'A': "电流 (A)",
+    'W': "功率 (W)",
+    'Hz': "频率 (Hz)",
+    '': "无单位",
+}
+
+PREFIXES = {
+    'p': 1e-12, 'n': 1e-9, 'u': 1e-6, 'μ': 1e-6, 'µ': 1e-6, 'm': 1e-3,
+    'k': 1e3, 'K': 1e3, 'M': 1e6, 'G': 1e9, 'R': 1, 'r': 1,
+}
+
+_UNITS = {'Ω': 'Ω', 'ohm': 'Ω', 'hz': 'Hz', 'f': 'F', 'h': 'H', 'v': 'V', 'a': 'A', 'w': 'W'}
+
+# 数字 [前缀 [紧跟前缀的 R 记法小数位，如 4K7]] [单位]；大写 M 为兆、小写 m 为毫
+_VALUE_RE = re.compile(
+    r'(\d+(?:\.\d+)?)\s*(?:([pnuμµmkKMGRr])(\d+)?)?\s*(Ω|[Oo][Hh][Mm]|[Hh][Zz]|[FfHhVvAaWw])?(?![A-Za-z])'
+)
+
+# 没写单位时按前缀推断：R / k / M / G 按电阻算 (10K、4R7)，p / n / u 按电容算 (100n)
+_BARE_PREFIX_FAMILY = {'R': 'Ω', 'r': 'Ω', 'k': 'Ω', 'K': 'Ω', 'M': 'Ω', 'G': 'Ω',
+                       'p': 'F', 'n': 'F', 'u': 'F', 'μ': 'F', 'µ': 'F'}
+
+
+def _match_value(m):
+    number, prefix, tail, unit = m.groups()
+    if tail and '.' not in number and prefix:
+        number = f"{number}.{tail}"  # 4K7 → 4.7K，4R7 → 4.7Ω
+    elif tail:
+        return None
+    value = float(number) * PREFIXES.get(prefix, 1)
+    if unit:
+        family = _UNITS[unit if unit == 'Ω' else unit.lower()]
+    else:
+        family = _BARE_PREFIX_FAMILY.get(prefix, '')
+    return family, value
+
+
+def parse_param(text):
+    """参数文字 → (单位族, 数值)；无法识别时返回 None
+
+    优先取第一个带单位 (或能按前缀推断单位) 的数值，"0603 4.7K" 里的封装号 0603 不会盖过 4.7K；
+    全都没有单位时才取第一个纯数字。
+    """
+    text = str(text).strip()
+    if not text or text == 'nan':
+        return None
+    bare = None
+    for m in _VALUE_RE.finditer(text):
+        parsed = _match_value(m)
+        if parsed is None:
+            continue
+        if parsed[0]:
+            return parsed
+        if bare is None:
+            bare = parsed
+    return bare
+
+
+def parse_si(text):
+    """界面输入的数值 ("4.7k"、"22K"、"100n"、"1e3") → float；空字符串返回 None，无法识别抛 ValueError"""
+    text = str(text).strip()
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    m = _VALUE_RE.fullmatch(text)
+    parsed = _match_value(m) if m else None
+    if parsed is None:
+        raise ValueError(f"无法识别的数值: {text}")
+    return parsed[1]
+
+
+class ParamIndex:
+    """按单位族分组的有序数值索引 (线程安全，进程内各会话共享)"""
+
+    # 变化的行超过这个比例时整体重建 (一次排序) 比逐条插入更快
+    REBUILD_RATIO = 0.25
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.token = None
+        self._text = {}    # ID → 参数原文
+        self._entry = {}   # ID → (单位族, 数值)，无法解析的行不在这里
+        self._values = {}  # 单位族 → 有序数值列表
+        self._ids = {}     # 单位族 → 与 _values 一一对应的 ID
+
+    def sync(self, df, token=None):
+        """与 df 对齐：token 与上次相同时直接返回，否则只处理 参数 变化 / 新增 / 删除的行"""
+        with self.lock:
+            if token is not None and token == self.token:
+                return
+            ids = df[ID_COL].tolist()
+            texts = df['参数'].astype(str).tolist()
+            changed = [(i, t) for i, t in zip(ids, texts) if self._text.get(i) != t]
+            removed = self._text.keys() - set(ids)
+            if len(changed) + len(removed) > max(len(ids) * self.REBUILD_RATIO, 1000):
+                self._rebuild(zip(ids, texts))
+            else:
+                for pid in removed:
+                    self._remove(pid)
+                    del self._text[pid]
+                for pid, text in changed:
+                    self._remove(pid)
+                    self._add(pid, text)
+            self.token = token
+
+    def _rebuild(self, rows):
+        self._text, self._entry, groups = {}, {}, {}
+        for pid, text in rows:
+            self._text[pid] = text
+            parsed = parse_param(text)
+            if parsed is not None:
+                self._entry[pid] = parsed
+                groups.setdefault(parsed[0], []).append((parsed[1], pid))
+        self._values, self._ids = {}, {}
+        for family, pairs in groups.items():
+            pairs.sort()
+            self._values[family] = [v for v, _ in pairs]
+            self._ids[family] = [p for _, p in pairs]
+
+    def _add(self, pid, text):
+        self._text[pid] = text
+        parsed = parse_param(text)
+        if parsed is None:
+            return
+        family, value = parsed
+        values = self._values.setdefault(family, [])
+        ids = self._ids.setdefault(family, [])
+        pos = bisect_right(values, value)
+        values.insert(pos, value)
+        ids.insert(pos, pid)
+        self._entry[pid] = parsed
+
+    def _remove(self, pid):
+        parsed = self._entry.pop(pid, None)
+        if parsed is None:
+            return
+        family, value = parsed
+        values, ids = self._values[family], self._ids[family]
+        pos = bisect_left(values, value)
+        while ids[pos] != pid:  # 数值相同的行挨在一起，往后找到自己
+            pos += 1
+        del values[pos]
+        del ids[pos]
+
+    def families(self):
+        """各单位族的零件数"""
+        with self.lock:
+            return {f: len(v) for f, v in self._values.items() if v}
+
+    def range(self, family, lo=None, hi=None):
+        """单位族内 lo <= 数值 <= hi 的 ID 列表 (按数值升序)，lo / hi 为 None 表示不限"""
+        with self.lock:
+            values = self._values.get(family, [])
+            start = 0 if lo is None else bisect_left(values, lo)
+            end = len(values) if hi is None else bisect_right(values, hi)
+            return self._ids.get(family, [])[start:end]
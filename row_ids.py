@@ -0,0 +1,92 @@
+import uuid
+
+import pandas as pd
+
+# ==================== 🔑 行主键 ====================
+# 每张表都带一列 ID，排序 / 筛选 / 编辑 / 保存都不会改变它，
+# 所有"选中某一行"的操作都通过 ID → 行 的索引完成，不再按显示文字匹配。
+
+ID_COL = 'ID'
+
+
+def new_id():
+    """生成新的行 ID (带字母前缀，避免被 Excel / Sheets 识别成数字)"""
+    return 'r' + uuid.uuid4().hex[:11]
+
+
+def ensure_ids(df):
+    """补齐缺失或重复的 ID (原地修改)，返回是否有新分配的 ID"""
+    if ID_COL not in df.columns:
+        df.insert(0, ID_COL, '')
+    ids = df[ID_COL].fillna('').astype(str).str.strip()
+    bad = ids.isin(['', 'nan', 'None', '<NA>']) | ids.duplicated()
+    if bad.any():
+        ids = ids.copy()
+        ids.loc[bad] = [new_id() for _ in range(int(bad.sum()))]
+    df[ID_COL] = ids
+    return bool(bad.any())
+
+
+def build_index(df):
+    """ID → 行标签 的字典，查找为 O(1)"""
+    return dict(zip(df[ID_COL], df.index))
+
+
+def _coerce(col, val):
+    if col == '数量':
+        try:
+            return int(val)
+        except (TypeError, ValueError):
+            return 0
+    return '' if val is None else val
+
+
+def apply_editor_delta(df, view_df, delta):
+    """把 st.data_editor 的增量 (edited/added/deleted_rows) 按 ID 合并回全表
+
+    view_df 是传给编辑器的那张 (可能经过筛选、排序的) 表，增量里的行号都是它的位置。
+    新增行带有 ID (见 assign_added_ids) 时沿用该 ID，否则分配新的。返回新的 DataFrame，原表不变。
+    """
+    df = df.copy()
+    index = build_index(df)
+    view_ids = view_df[ID_COL].tolist()
+
+    for pos, changes in delta.get('edited_rows', {}).items():
+        idx = index.get(view_ids[int(pos)])
+        if idx is None:
+            continue
+        for col, val in changes.items():
+            if col in df.columns and col != ID_COL:
+                df.at[idx, col] = _coerce(col, val)
+
+    deleted = [index[view_ids[pos]] for pos in delta.get('deleted_rows', []) if view_ids[pos] in index]
+    if deleted:
+        df = df.drop(index=deleted)
+
+    added = [{col: _coerce(col, val) for col, val in row.items()}
+             for row in delta.get('added_rows', []) if row]
+    if added:
+        new_rows = pd.DataFrame(added).reindex(columns=df.columns)
+        new_rows = new_rows.fillna({c: 0 if c == '数量' else '' for c in new_rows.columns})
+        df = pd.concat([df, new_rows], ignore_index=True)
+
+    if '数量' in df.columns:
+        df['数量'] = pd.to_numeric(df['数量'], errors='coerce').fillna(0).astype(int)
+    ensure_ids(df)
+    return df
+
+
+def assign_added_ids(delta):
+    """给编辑器新增的行预先分配 ID，返回新的增量 (原增量不变)
+
+    同一份增量可能被应用多次 (写入调度器先改本地缓存，写入前再基于云端最新数据重放一次)，
+    ID 在这里定好，每次应用得到的新行 ID 都相同。
+    """
+    added = [{**row, ID_COL: row.get(ID_COL) or new_id()} if row else row
+             for row in delta.get('added_rows', [])]
+    return {**delta, 'added_rows': added}
+
+
+def has_changes(delta):
+    """编辑器增量是否非空"""
+    return bool(delta and (delta.get('edited_rows') or delta.get('added_rows') or delta.get('deleted_rows')))
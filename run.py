@@ -15,5 +15,6 @@ if __name__ == "__main__":
         "run",
         resolve_path("inventory_app.py"), # 这里必须是你主程序的名字
         "--global.developmentMode=false",
+        "--server.enableStaticServing=true",  # 背景图走静态文件 (见 inventory_app.set_background)
     ]
     sys.exit(stcli.main())
\ No newline at end of file
@@ -0,0 +1,170 @@
+"""多进程共享的库存快照 (Arrow IPC + 内存映射)
+
+多个 Streamlit 进程同时服务时，不再各自解析 xlsx、各自持有一份 DataFrame：
+    - 每次保存后把整张表发布为不可变的 Arrow IPC 文件 <表名>-<版本号>.arrow
+    - 指针文件 <表名>.json 记录当前版本号、文件名、发布时间和数据源 (xlsx) 的修改时间
+    - 各进程用 pyarrow.memory_map 零拷贝映射同一个文件，操作系统只缓存一份，
+      转成 pandas 时使用 ArrowDtype，列数据仍然指向映射的内存
+    - 会话每次 rerun 只比较版本号，版本变了才换成新的快照
+
+数据源被外部修改 (例如直接用 Excel 打开改过) 时修改时间对不上，视为没有快照，重新解析后发布。
+"""
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+
+# 每张表保留的历史版本数 (正在被其他进程映射的旧文件不会立刻删除)
+KEEP_VERSIONS = 3
+
+# 更新指针时的锁文件：超过这个秒数仍在的锁视为持有者已崩溃
+LOCK_STALE = 10
+
+
+def source_mtime(source_file):
+    """数据源的修改时间 (纳秒)；保存方应在写完文件后立即取，再传给 publish"""
+    if source_file is None:
+        return None
+    try:
+        return os.stat(source_file).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _normalize(df):
+    """数量 转整数，其余文本列 (object 或 pandas 的 str 类型) 空值补成 ''，保证能写成 Arrow 且类型稳定"""
+    df = df.copy()
+    for col in df.columns:
+        if col == '数量':
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+        elif pd.api.types.is_string_dtype(df[col].dtype):
+            df[col] = df[col].fillna('').astype(str)
+    return df
+
+
+class SnapshotStore:
+    """一个目录下的全部表快照；同一进程内已映射的表会复用"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self._mapped = {}  # 表名 → (文件名, pyarrow.Table)
+        os.makedirs(directory, exist_ok=True)
+
+    def _pointer_path(self, table):
+        return os.path.join(self.directory, f"{table}.json")
+
+    @contextlib.contextmanager
+    def _pointer_lock(self, table):
+        """跨进程互斥地 读-比较-替换 指针 (独占创建锁文件)"""
+        path = os.path.join(self.directory, f"{table}.lock")
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(path).st_mtime > LOCK_STALE:
+                        os.remove(path)
+                        continue
+                except OSError:
+                    continue  # 锁刚被释放
+                time.sleep(0.005)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(path)
+
+    def _read_pointer(self, table):
+        try:
+            with open(self._pointer_path(table), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _pointer(self, table, source_file=None, max_age=None):
+        """当前有效的指针；数据源文件改过或快照过期时返回 None"""
+        ptr = self._read_pointer(table)
+        if ptr is None:
+            return None
+        if source_file is not None and ptr.get('source_mtime') != source_mtime(source_file):
+            return None
+        if max_age is not None and time.time() - ptr.get('published_at', 0) > max_age:
+            return None
+        return ptr
+
+    def version(self, table, source_file=None, max_age=None):
+        """当前快照的版本号，没有可用快照时为 None (每次 rerun 调用，只读一个小文件)"""
+        ptr = self._pointer(table, source_file, max_age)
+        return ptr['version'] if ptr else None
+
+    def get(self, table, source_file=None, max_age=None):
+        """映射当前快照并返回 (版本号, DataFrame)，没有可用快照时返回 (None, None)
+
+        source_file 给出时要求它的修改时间与发布时一致；max_age (秒) 给出时要求快照足够新。
+        """
+        ptr = self._pointer(table, source_file, max_age)
+        if ptr is None:
+            return None, None
+        with self.lock:
+            cached = self._mapped.get(table)
+            if cached is None or cached[0] != ptr['file']:
+                try:
+                    mm = pa.memory_map(os.path.join(self.directory, ptr['file']))
+                    cached = (ptr['file'], pa.ipc.open_file(mm).read_all())
+                except (OSError, pa.ArrowInvalid):
+                    return None, None
+                self._mapped[table] = cached  # 旧版本在没有会话引用后自动释放
+        return ptr['version'], cached[1].to_pandas(types_mapper=pd.ArrowDtype)
+
+    def publish(self, table, df, source_file=None, mtime=None):
+        """把 df 发布为新版本，返回版本号
+
+        mtime 是数据源写完时的修改时间 (见 source_mtime)；不给时在这里读 source_file 的，
+        但那时文件可能已经被别人改过。
+        版本号通过独占创建文件分配，多个进程同时发布也不会重号；
+        指针文件在锁内比较版本后写临时文件再 os.replace，版本号只增不减，
+        读者看到的要么是旧版本要么是新版本。
+        """
+        if mtime is None:
+            mtime = source_mtime(source_file)
+        data = pa.Table.from_pandas(_normalize(df), preserve_index=False)
+        ptr = self._read_pointer(table)
+        version = (ptr['version'] if ptr else 0) + 1
+        while True:
+            name = f"{table}-{version:08d}.arrow"
+            try:
+                f = open(os.path.join(self.directory, name), 'xb')
+                break
+            except FileExistsError:
+                version += 1
+        with f:
+            with pa.ipc.new_file(f, data.schema) as writer:
+                writer.write_table(data)
+
+        with self._pointer_lock(table):
+            latest = self._read_pointer(table)
+            if latest is None or latest['version'] < version:
+                new_ptr = {'version': version, 'file': name, 'source_mtime': mtime, 'published_at': time.time()}
+                tmp = self._pointer_path(table) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, 'w', encoding='utf-8') as fp:
+                    json.dump(new_ptr, fp)
+                os.replace(tmp, self._pointer_path(table))
+        self._prune(table, version)
+        return version
+
+    def _prune(self, table, version):
+        pattern = re.compile(rf'^{re.escape(table)}-(\d{{8}})\.arrow$')
+        for name in os.listdir(self.directory):
+            m = pattern.match(name)
+            if m and int(m.group(1)) <= version - KEEP_VERSIONS:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass  # Windows 下仍被映射的文件删不掉，下次再删
@@ -0,0 +1,196 @@
+"""库存变动事件流 (追加写入的 JSONL 日志)
+
+每一次改动数量的操作都会记录为一条 StockEvent：入库、出库、BOM 扣减、表格手动修改、删除整行。
+日志按大小切分为多个分段文件 events-000001.jsonl, events-000002.jsonl, ...，只追加不修改。
+
+下游 (采购看板、ERP 同步) 用 Subscriber 按偏移量增量消费，不需要反复读取整张表再做对比：
+
+    log = EventLog("stock_events")
+    sub = Subscriber(log, "erp-sync")
+    for offset, event in sub.poll():
+        handle(event)
+        sub.commit(offset)
+
+偏移量是一个整数：高 32 位为分段号，低 32 位为该分段内的字节位置，可直接比较大小。
+"""
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, asdict, fields
+from datetime import datetime
+
+import pandas as pd
+
+from row_ids import ID_COL
+
+INBOUND = 'inbound'
+OUTBOUND = 'outbound'
+BOM_DEDUCT = 'bom_deduct'
+MANUAL_EDIT = 'manual_edit'
+REMOVED = 'removed'  # 整行被删除 (不是领用，消耗统计不计入)
+EVENT_KINDS = (INBOUND, OUTBOUND, BOM_DEDUCT, MANUAL_EDIT, REMOVED)
+
+# 事件里用来描述零件的列 (存在哪列就用哪列)
+LABEL_COLS = ['名称', '参数', '规格', '长度', '类型', '尺寸', '封装']
+
+_SEGMENT_RE = re.compile(r'^events-(\d{6})\.jsonl$')
+
+
+@dataclass
+class StockEvent:
+    kind: str       # 见 EVENT_KINDS
+    table: str      # 表名，如 electronics / screws / pcbs
+    part_id: str    # 行 ID (row_ids.ID_COL)
+    delta: int      # 数量变化，入库为正、出库为负
+    qty: int        # 变化后的数量
+    part: str = ''  # 零件描述，便于人读
+    user: str = ''
+    ts: str = ''    # ISO 时间，带时区
+    app: str = ''   # 产生事件的程序
+
+    def __post_init__(self):
+        if self.kind not in EVENT_KINDS:
+            raise ValueError(f"未知事件类型: {self.kind}")
+        if not self.ts:
+            self.ts = now_iso()
+
+    def to_json(self):
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, line):
+        data = json.loads(line)
+        return cls(**{f.name: data[f.name] for f in fields(cls) if f.name in data})
+
+
+def now_iso():
+    return datetime.now().astimezone().isoformat(timespec='seconds')
+
+
+def make_offset(segment, position):
+    return (segment << 32) | position
+
+
+def split_offset(offset):
+    return offset >> 32, offset & 0xFFFFFFFF
+
+
+def part_label(row):
+    """用一行里的描述列拼出零件名称"""
+    return ' '.join(str(row[c]) for c in LABEL_COLS if c in row and str(row[c]) not in ('', 'nan'))
+
+
+def diff_events(old, new, table, kind, user='', app=''):
+    """按 ID 对比两张表的 数量 列，生成事件 (新增的行 delta=数量，删除的行 delta=-数量)
+
+    删除的行不论 kind 是什么都记为 REMOVED，和领用、改数量区分开。
+    """
+    if ID_COL not in old.columns or ID_COL not in new.columns:
+        return []
+    a = old.set_index(ID_COL)['数量'].rename('old')
+    b = new.set_index(ID_COL)['数量'].rename('new')
+    joined = pd.concat([a, b], axis=1)
+    removed = set(joined.index[joined['new'].isna()])
+    joined = joined.fillna(0).astype(int)
+    changed = joined[joined['old'] != joined['new']]
+    if changed.empty:
+        return []
+    labels = pd.concat([old, new]).drop_duplicates(ID_COL, keep='last').set_index(ID_COL)
+    ts = now_iso()
+    return [
+        StockEvent(REMOVED if pid in removed else kind, table, str(pid), int(r['new'] - r['old']), int(r['new']),
+                   part_label(labels.loc[pid]), user, ts, app)
+        for pid, r in changed.iterrows()
+    ]
+
+
+class EventLog:
+    """按大小切分的追加式事件日志 (线程安全；多进程同时追加时每批事件一次 write)"""
+
+    def __init__(self, directory, segment_bytes=4 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def segments(self):
+        found = []
+        for name in os.listdir(self.directory):
+            m = _SEGMENT_RE.match(name)
+            if m:
+                found.append(int(m.group(1)))
+        return sorted(found)
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"events-{segment:06d}.jsonl")
+
+    def append(self, events):
+        """追加一批事件，返回写入后的末尾偏移量"""
+        events = list(events)
+        if not events:
+            return self.end_offset()
+        payload = ''.join(e.to_json() + '\n' for e in events).encode('utf-8')
+        with self.lock:
+            segs = self.segments()
+            segment = segs[-1] if segs else 1
+            path = self._path(segment)
+            if os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes:
+                segment += 1
+                path = self._path(segment)
+            with open(path, 'ab') as f:
+                f.write(payload)
+                position = f.tell()
+        return make_offset(segment, position)
+
+    def end_offset(self):
+        segs = self.segments()
+        if not segs:
+            return 0
+        return make_offset(segs[-1], os.path.getsize(self._path(segs[-1])))
+
+    def read(self, offset=0):
+        """从 offset 开始逐条读取，生成 (下一条的偏移量, StockEvent)；只读完整的行"""
+        start_seg, position = split_offset(offset)
+        for segment in self.segments():
+            if segment < start_seg:
+                continue
+            pos = position if segment == start_seg else 0
+            with open(self._path(segment), 'rb') as f:
+                f.seek(pos)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # 另一个进程还没写完的行
+                    pos += len(line)
+                    yield make_offset(segment, pos), StockEvent.from_json(line.decode('utf-8'))
+
+
+class Subscriber:
+    """有名字的消费者，已处理到的偏移量保存在 <日志目录>/offsets/<name>.json"""
+
+    def __init__(self, log, name):
+        self.log = log
+        self.name = name
+        self.path = os.path.join(log.directory, 'offsets', f"{name}.json")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.offset = 0
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                self.offset = json.load(f).get('offset', 0)
+
+    def poll(self, max_events=1000):
+        """读取尚未提交的事件 (最多 max_events 条)，返回 [(偏移量, 事件)]"""
+        out = []
+        for item in self.log.read(self.offset):
+            out.append(item)
+            if len(out) >= max_events:
+                break
+        return out
+
+    def commit(self, offset):
+        """确认已处理到 offset (写临时文件再替换，中途崩溃也不会损坏)"""
+        self.offset = offset
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'offset': offset, 'ts': now_iso()}, f)
+        os.replace(tmp, self.path)
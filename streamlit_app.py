@@ -1,8 +1,22 @@
 import streamlit as st
 import pandas as pd
 from streamlit_gsheets import GSheetsConnection
+import os
 import re
 import time
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from row_ids import ID_COL, new_id, ensure_ids, build_index, apply_editor_delta, assign_added_ids, has_changes
+from write_scheduler import WriteScheduler
+from exporter import REPORTS, FORMATS, iter_frame, build_report, export_to_tempfile, export_filename
+from stock_events import EventLog, diff_events, INBOUND, OUTBOUND, MANUAL_EDIT
+from snapshot import SnapshotStore
+from consumption import ConsumptionRollup, forecast
+from upload_cache import read_upload
+from param_index import ParamIndex, UNIT_FAMILIES, parse_si
 
 # ==================== 🔐 账号密码配置 ====================
 # 格式： "用户名": "密码"
@@ -113,17 +127,125 @@ conn = st.connection("gsheets", type=GSheetsConnection)
 SHEET_ELEC = "electronics"
 SHEET_SCREW = "screws"
 SHEET_PCB = "pcbs"
+ALL_SHEETS = [SHEET_ELEC, SHEET_SCREW, SHEET_PCB]
+SHEET_LABELS = {SHEET_ELEC: "电子元器件", SHEET_SCREW: "五金螺丝", SHEET_PCB: "PCB电路板"}
+
+# 低库存阈值 (仪表盘与补货报表共用)
+LOW_STOCK = {SHEET_ELEC: 10, SHEET_SCREW: 20, SHEET_PCB: 5}
+
+# 预取缓存的有效期 (秒)，过期后下一次访问会重新从云端读取
+SHEET_CACHE_TTL = 60
+
+# 写入调度：每秒平均请求数 / 最多突发次数 / 合并窗口 (秒)
+# Sheets API 默认配额为每用户每分钟 60 次读写，调度器每次合并写入 = 1 读 + 1 写
+WRITE_RATE = 0.8
+WRITE_BURST = 5
+WRITE_WINDOW = 0.5
+
+# 库存变动事件日志目录 (写入云端成功后追加，供下游按偏移量消费)
+EVENT_DIR = os.environ.get('STOCK_EVENT_DIR', 'stock_events')
+
+# 多个服务进程共享的表快照目录 (见 snapshot.py)，新进程在 SHEET_CACHE_TTL 内直接映射，不再读云端
+SNAPSHOT_DIR = os.environ.get('STOCK_SNAPSHOT_DIR', 'stock_snapshot')
 
 
 # ==================== 🔧 核心函数 ====================
 
+def _fetch_sheet(sheet_name):
+    """读取并规整一张表，返回 (df, 是否新分配了ID, 耗时)。不调用界面函数，可在线程池中运行"""
+    start = time.perf_counter()
+    df = conn.read(worksheet=sheet_name, ttl=0)
+    df = df.fillna("")
+    if '数量' in df.columns:
+        df['数量'] = pd.to_numeric(df['数量'], errors='coerce').fillna(0).astype(int)
+    assigned = not df.empty and ensure_ids(df)
+    return df, assigned, time.perf_counter() - start
+
+
+@st.cache_resource
+def get_snapshot(directory):
+    """进程内共享的快照存储，已映射的表在所有会话间复用"""
+    return SnapshotStore(directory)
+
+
+def _read_sheet(sheet_name):
+    """优先映射其他进程刚发布的快照，没有或已过期时从云端读取并发布
+
+    返回 (df, 是否新分配了ID, 耗时, 快照版本号)。可在线程池中运行。
+    """
+    snap = get_snapshot(SNAPSHOT_DIR)
+    start = time.perf_counter()
+    snap_version, df = snap.get(sheet_name, max_age=SHEET_CACHE_TTL)
+    if df is not None:
+        return df, False, time.perf_counter() - start, snap_version
+    df, assigned, elapsed = _fetch_sheet(sheet_name)
+    if not assigned:  # 需要补 ID 的表由 save_data 写回后再发布
+        snap_version = snap.publish(sheet_name, df)
+    return df, assigned, elapsed, snap_version
+
+
+# 缓存表每换一次内容 (重新读取、乐观更新) 取一个新编号，派生的索引按它判断是否要更新
+_REVISIONS = itertools.count(1)
+
+
+def _cache_put(sheet_name, df, elapsed=None, version=None, snap_version=None):
+    if version is None:
+        version = get_writer().latest(sheet_name)[0]
+    st.session_state.sheet_cache[sheet_name] = {'df': df.copy(), 'at': time.time(), 'version': version,
+                                                'snap': snap_version, 'rev': next(_REVISIONS)}
+    if elapsed is not None:
+        st.session_state.sheet_timing[sheet_name] = elapsed
+
+
+def invalidate(sheet_name):
+    """丢弃某张表的缓存，下次访问时重新读取"""
+    st.session_state.get('sheet_cache', {}).pop(sheet_name, None)
+
+
+def prefetch_all():
+    """登录后并发预取全部工作表，切换仓库时直接命中缓存"""
+    st.session_state.setdefault('sheet_cache', {})
+    st.session_state.setdefault('sheet_timing', {})
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(max_workers=len(ALL_SHEETS),
+                            initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)) as pool:
+        futures = {name: pool.submit(_read_sheet, name) for name in ALL_SHEETS}
+    for name, fut in futures.items():
+        try:
+            df, assigned, elapsed, snap_version = fut.result()
+        except Exception as e:
+            st.error(f"预取 {name} 失败: {e}")
+            continue
+        # 表里还没有 ID 列时，分配后立即写回，保证 ID 稳定
+        if assigned:
+            save_data(df, name)
+            st.session_state.sheet_timing[name] = elapsed
+        else:
+            _cache_put(name, df, elapsed, snap_version=snap_version)
+
+
 def load_data(sheet_name):
-    """从云端读取数据 (不缓存)"""
+    """读取数据：优先使用预取缓存，过期或未命中时从云端读取"""
+    st.session_state.setdefault('sheet_cache', {})
+    st.session_state.setdefault('sheet_timing', {})
+    entry = st.session_state.sheet_cache.get(sheet_name)
+    # 调度器刚写入过更新的版本 (可能来自其他用户)，直接用它
+    version, latest = get_writer().latest(sheet_name)
+    if latest is not None and (entry is None or entry['version'] < version):
+        _cache_put(sheet_name, latest, version=version)
+        entry = st.session_state.sheet_cache[sheet_name]
+    # 其他进程发布了新快照 (它们的写入)，换成新版本；只比较版本号
+    snap_version = get_snapshot(SNAPSHOT_DIR).version(sheet_name, max_age=SHEET_CACHE_TTL)
+    if entry and snap_version is not None and entry.get('snap') != snap_version:
+        entry = None
+    if entry and time.time() - entry['at'] < SHEET_CACHE_TTL:
+        return entry['df'].copy()
     try:
-        df = conn.read(worksheet=sheet_name, ttl=0)
-        df = df.fillna("")
-        if '数量' in df.columns:
-            df['数量'] = pd.to_numeric(df['数量'], errors='coerce').fillna(0).astype(int)
+        df, assigned, elapsed, snap_version = _read_sheet(sheet_name)
+        if assigned:
+            save_data(df, sheet_name)
+        else:
+            _cache_put(sheet_name, df, elapsed, snap_version=snap_version)
         return df
     except Exception as e:
         st.error(f"连接云端失败: {e}")
@@ -131,16 +253,165 @@ def load_data(sheet_name):
 
 
 def save_data(df, sheet_name):
-    """保存数据到云端"""
+    """直接整表写回云端 (会就地补齐缺失的行 ID)。日常修改请用 submit_write"""
     try:
+        ensure_ids(df)
         conn.update(worksheet=sheet_name, data=df)
         st.cache_data.clear()
+        _cache_put(sheet_name, df, snap_version=get_snapshot(SNAPSHOT_DIR).publish(sheet_name, df))
         return True
     except Exception as e:
         st.error(f"云端保存失败: {e}")
         return False
 
 
+@st.cache_resource
+def get_writer():
+    """进程内共享的写入调度器，所有会话的修改都在这里排队合并"""
+    snap = get_snapshot(SNAPSHOT_DIR)
+
+    def write_fn(name, df):
+        conn.update(worksheet=name, data=df)
+        try:
+            snap.publish(name, df)  # 其他服务进程按版本号换到合并后的数据
+        except Exception:
+            pass  # 快照只是加速，云端已写入成功，不能因此重试
+
+    return WriteScheduler(
+        read_fn=lambda name: _fetch_sheet(name)[0],
+        write_fn=write_fn,
+        rate=WRITE_RATE, burst=WRITE_BURST, window=WRITE_WINDOW,
+    )
+
+
+def _cache_rev(sheet_name):
+    entry = st.session_state.get('sheet_cache', {}).get(sheet_name)
+    return entry.get('rev') if entry else None
+
+
+def param_index(sheet_name, df):
+    """本会话的 参数 数值索引 (各会话的乐观更新不同，不跨会话共享)
+
+    缓存内容没变时直接复用；变了只重新解析 参数 变化过的行。
+    """
+    index = st.session_state.setdefault(f'param_index_{sheet_name}', ParamIndex())
+    index.sync(df, token=_cache_rev(sheet_name))
+    return index
+
+
+def row_index(sheet_name, df):
+    """ID → 行 字典，按缓存版本复用；df 须是 load_data 刚返回的表"""
+    rev = _cache_rev(sheet_name)
+    key = f'row_index_{sheet_name}'
+    cached = st.session_state.get(key)
+    if rev is not None and cached and cached[0] == rev:
+        return cached[1]
+    row_of = build_index(df)
+    st.session_state[key] = (rev, row_of)
+    return row_of
+
+
+@st.cache_resource
+def get_event_log():
+    return EventLog(EVENT_DIR)
+
+
+@st.cache_resource
+def get_rollup(event_dir):
+    """进程内共享的消耗汇总，从事件日志增量更新"""
+    return ConsumptionRollup(get_event_log(), os.path.join(event_dir, 'rollup'))
+
+
+def tracked(sheet_name, kind, mutation):
+    """包装修改函数：每次应用时按 ID 对比数量变化，写入成功后把事件追加到日志
+
+    调度器可能基于更新的云端数据重新应用修改，事件以最后一次应用 (即真正写入的那次) 为准。
+    """
+    user = st.session_state.get('username', '')
+    state = {'events': []}
+
+    def wrapped(df):
+        new = mutation(df)
+        state['events'] = diff_events(df, new, sheet_name, kind, user, 'streamlit_app')
+        return new
+
+    log = get_event_log()
+    return wrapped, lambda: log.append(state['events'])
+
+
+def submit_write(sheet_name, mutation, done_msg, kind=MANUAL_EDIT):
+    """提交一次修改：本地缓存立即生效，云端写入由调度器在后台合并执行
+
+    mutation(df) 返回修改后的新表；调度器会在写入前基于云端最新数据重新应用它，
+    所以多人同时操作不会互相覆盖。kind 为记录到事件日志里的变动类型。
+    """
+    mutation, on_commit = tracked(sheet_name, kind, mutation)
+    entry = st.session_state.sheet_cache.get(sheet_name)
+    if entry:
+        try:
+            entry['df'] = mutation(entry['df'])
+            entry['rev'] = next(_REVISIONS)
+        except Exception as e:
+            st.error(str(e))
+            return False
+    fut = get_writer().submit(sheet_name, mutation, on_commit)
+    st.session_state.setdefault('pending_writes', []).append((sheet_name, fut, done_msg))
+    return True
+
+
+def write_status():
+    """后台写入结果回报：全部完成后整页刷新一次，拿到合并后的云端数据"""
+    pending = st.session_state.get('pending_writes', [])
+    still = [w for w in pending if not w[1].done()]
+    for sheet_name, fut, msg in pending:
+        if not fut.done():
+            continue
+        if fut.exception():
+            st.session_state.setdefault('write_errors', []).append(f"{msg} → 云端保存失败: {fut.exception()}")
+            invalidate(sheet_name)
+        else:
+            st.toast(f"☁️ {msg}")
+    st.session_state.pending_writes = still
+    if still:
+        st.caption(f"⏳ {len(still)} 个修改正在写入云端...")
+    elif pending:
+        data_changed()
+
+
+# ==================== ✏️ 修改操作 (交给写入调度器) ====================
+
+def add_or_accumulate(keys, qty, defaults):
+    """入库：按 keys 中的列匹配已有行则累加数量，否则新增一行"""
+    row_id = new_id()
+
+    def mutation(df):
+        df = df.copy()
+        mask = pd.Series(True, index=df.index)
+        for col, val in keys.items():
+            mask &= df[col].astype(str) == str(val)
+        if mask.any():
+            df.loc[mask, '数量'] += qty
+        else:
+            new_row = pd.DataFrame([{ID_COL: row_id, **keys, **defaults, '数量': qty}])
+            df = pd.concat([df, new_row], ignore_index=True)
+        return df
+    return mutation
+
+
+def take_out(part_id, qty):
+    """出库：按 ID 扣减，库存不足时报错"""
+    def mutation(df):
+        df = df.copy()
+        idx = build_index(df).get(part_id)
+        if idx is None:
+            raise ValueError("该记录已被删除，请刷新后重试")
+        if df.at[idx, '数量'] < qty:
+            raise ValueError(f"库存不足！仅剩 {df.at[idx, '数量']}")
+        df.at[idx, '数量'] -= qty
+        return df
+    return mutation
+
+
 def get_sort_value(name):
     name = str(name).upper().strip()
     match = re.search(r'(\d+\.?\d*)\s*([KMGUNPμR]?)', name)
@@ -154,7 +425,111 @@ def get_sort_value(name):
     return float('inf')
 
 
+# ==================== 🧩 局部刷新 ====================
+# 页面拆成几个 st.fragment：筛选、搜索、填写表单时只重跑所在的片段，
+# 不再重画侧边栏、仪表盘和整张表格。
+# 片段之间不会自动同步，提交了修改或刷新了数据时调用 data_changed() 整页重跑一次。
+
+def data_changed():
+    """数据已改变：整页重跑一次，让仪表盘和其他片段拿到新数据"""
+    st.rerun(scope="app")
+
+
+@st.fragment
+def kpi_panel(sheet_name, labels, show_low=False):
+    """仪表盘：labels 为 (种类, 总数, 低库存) 三个标题，show_low 时附带低库存明细"""
+    df = load_data(sheet_name)
+    low_stock = df[df['数量'] < LOW_STOCK[sheet_name]]
+    c1, c2, c3 = st.columns(3)
+    c1.metric(labels[0], len(df))
+    c2.metric(labels[1], df['数量'].sum())
+    c3.metric(labels[2], len(low_stock), delta_color="inverse")
+
+    if show_low and not low_stock.empty:
+        with st.expander(f"🔴 查看 {len(low_stock)} 个缺货器件"):
+            st.dataframe(low_stock, use_container_width=True)
+
+
 # ==================== 📱 电子元器件 ====================
+@st.fragment
+def elec_overview():
+    """筛选面板和表格放在同一个片段：表格依赖筛选条件，拆开的话筛选一次还得整页重跑"""
+    df = load_data(SHEET_ELEC)
+    col1, col2 = st.columns([1, 4])
+    with col1:
+        st.markdown("##### 🛠 操作")
+        if st.button("🔄 强制刷新", use_container_width=True):
+            invalidate(SHEET_ELEC)
+            data_changed()
+        st.divider()
+        st.markdown("##### 🔍 筛选")
+        sort_mode = st.selectbox("排序", ["智能排序", "库存倒序", "库存正序"])
+        filter_type = st.multiselect("类型", df['类型'].unique() if '类型' in df.columns else [])
+        # 参数范围：按单位族建有序索引，二分查找，不扫全表
+        p_index = param_index(SHEET_ELEC, df)
+        families = p_index.families()
+        p_family = st.selectbox("参数单位", [None] + [f for f in UNIT_FAMILIES if f in families],
+                                format_func=lambda f: "(不限)" if f is None else UNIT_FAMILIES[f])
+        pc1, pc2 = st.columns(2)
+        p_min_txt = pc1.text_input("最小值", placeholder="4.7k", disabled=p_family is None)
+        p_max_txt = pc2.text_input("最大值", placeholder="22k", disabled=p_family is None)
+        try:
+            p_min, p_max = parse_si(p_min_txt), parse_si(p_max_txt)
+        except ValueError as e:
+            st.caption(f"⚠️ {e}，支持 4.7k / 100n / 1M 这类写法")
+            p_min = p_max = None
+        search = st.text_input("搜索...", placeholder="输入型号或参数")
+
+    with col2:
+        if p_family is not None:
+            row_of = row_index(SHEET_ELEC, df)
+            display_df = df.loc[[row_of[i] for i in p_index.range(p_family, p_min, p_max) if i in row_of]]
+        else:
+            display_df = df.copy()
+        if filter_type: display_df = display_df[display_df['类型'].isin(filter_type)]
+        if search:
+            mask = display_df.astype(str).apply(lambda x: x.str.contains(search, case=False)).any(axis=1)
+            display_df = display_df[mask]
+
+        if sort_mode == "智能排序":
+            display_df['sort_val'] = display_df['参数'].apply(get_sort_value)
+            display_df = display_df.sort_values(by=['类型', '名称', 'sort_val'])
+            display_df = display_df.drop(columns=['sort_val'])
+        elif sort_mode == "库存倒序":
+            display_df = display_df.sort_values(by='数量', ascending=False)
+        elif sort_mode == "库存正序":
+            display_df = display_df.sort_values(by='数量')
+
+        st.data_editor(
+            display_df, use_container_width=True, num_rows="dynamic", height=500, key="elec_editor",
+            column_config={ID_COL: None}
+        )
+
+        # 编辑增量按 ID 合并回全表，筛选/搜索状态下保存也不会丢行
+        if st.button("💾 保存更改到云端", type="primary", use_container_width=True):
+            delta = st.session_state.get("elec_editor")
+            if has_changes(delta):
+                # 新增行的 ID 在提交前定好，本地缓存与写回云端的是同一个 ID
+                delta = assign_added_ids(delta)
+                if submit_write(SHEET_ELEC, lambda d: apply_editor_delta(d, display_df, delta), "✅ 电子元器件已保存"):
+                    data_changed()
+
+
+@st.fragment
+def elec_batch_inbound():
+    st.write("批量上传 Excel 追加库存")
+    up_file = st.file_uploader("上传 Excel 入库单", type=['xlsx'])
+    if up_file:
+        # 按内容哈希只解析一次；缓存是共享的，补 ID 前先复制
+        new_data = read_upload(up_file)[1].copy()
+        st.write("预览:", new_data.head())
+        if st.button("🚀 确认追加到云端"):
+            ensure_ids(new_data)
+            if submit_write(SHEET_ELEC, lambda d: pd.concat([d, new_data], ignore_index=True),
+                            f"入库成功！共 {len(new_data)} 条", INBOUND):
+                data_changed()
+
+
 def render_electronics():
     st.markdown("## ☁️ 电子元器件 (Google Sheets)")
     df = load_data(SHEET_ELEC)
@@ -162,76 +537,95 @@ def render_electronics():
         st.info("初始化中或表格为空...")
         return
 
-    c1, c2, c3 = st.columns(3)
-    c1.metric("📦 种类", len(df))
-    c2.metric("🔢 总数", df['数量'].sum())
-    low_stock = df[df['数量'] < 10]
-    c3.metric("⚠️ 缺货", len(low_stock), delta_color="inverse")
-
-    if not low_stock.empty:
-        with st.expander(f"🔴 查看 {len(low_stock)} 个缺货器件"):
-            st.dataframe(low_stock, use_container_width=True)
+    kpi_panel(SHEET_ELEC, ("📦 种类", "🔢 总数", "⚠️ 缺货"), show_low=True)
 
     st.markdown("---")
     tab1, tab2, tab3 = st.tabs(["📊 总览与管理", "📥 批量入库", "📤 BOM出库"])
 
     with tab1:
-        col1, col2 = st.columns([1, 4])
-        with col1:
-            st.markdown("##### 🛠 操作")
-            if st.button("🔄 强制刷新", use_container_width=True): st.rerun()
-            st.divider()
-            st.markdown("##### 🔍 筛选")
-            sort_mode = st.selectbox("排序", ["智能排序", "库存倒序", "库存正序"])
-            filter_type = st.multiselect("类型", df['类型'].unique() if '类型' in df.columns else [])
-            search = st.text_input("搜索...", placeholder="输入型号或参数")
-
-        with col2:
-            display_df = df.copy()
-            if filter_type: display_df = display_df[display_df['类型'].isin(filter_type)]
-            if search:
-                mask = display_df.astype(str).apply(lambda x: x.str.contains(search, case=False)).any(axis=1)
-                display_df = display_df[mask]
-
-            if sort_mode == "智能排序":
-                display_df['sort_val'] = display_df['参数'].apply(get_sort_value)
-                display_df = display_df.sort_values(by=['类型', '名称', 'sort_val'])
-                display_df = display_df.drop(columns=['sort_val'])
-            elif sort_mode == "库存倒序":
-                display_df = display_df.sort_values(by='数量', ascending=False)
-            elif sort_mode == "库存正序":
-                display_df = display_df.sort_values(by='数量')
-
-            edited_df = st.data_editor(
-                display_df, use_container_width=True, num_rows="dynamic", height=500, key="elec_editor"
-            )
-
-            if len(edited_df) != len(df):
-                st.warning("⚠️ 筛选或搜索模式下 **禁止保存**。请清空筛选条件，显示全表后再保存。")
-            else:
-                if st.button("💾 保存更改到云端", type="primary", use_container_width=True):
-                    if save_data(edited_df, SHEET_ELEC):
-                        st.success("✅ 云端保存成功！")
-                        time.sleep(1)
-                        st.rerun()
-
+        elec_overview()
     with tab2:
-        st.write("批量上传 Excel 追加库存")
-        up_file = st.file_uploader("上传 Excel 入库单", type=['xlsx'])
-        if up_file:
-            new_data = pd.read_excel(up_file)
-            st.write("预览:", new_data.head())
-            if st.button("🚀 确认追加到云端"):
-                updated_df = pd.concat([df, new_data], ignore_index=True)
-                if save_data(updated_df, SHEET_ELEC):
-                    st.success("入库成功！")
-                    time.sleep(1)
-                    st.rerun()
+        elec_batch_inbound()
     with tab3:
         st.info("💡 提示：云端版建议直接在 [总览] 页面搜索型号，然后手动修改库存数量。")
 
 
 # ==================== 🔩 五金螺丝 (修复版) ====================
+@st.fragment
+def screw_ops():
+    df = load_data(SHEET_SCREW)
+    tab_in, tab_out = st.tabs(["📥 入库", "📤 出库"])
+
+    # === 入库逻辑 ===
+    with tab_in:
+        with st.form("screw_add"):
+            # 强制转为字符串处理
+            spec = st.text_input("规格", placeholder="M3")
+            length = st.text_input("长度", placeholder="10mm")
+            stype = st.text_input("类型", placeholder="圆头")
+            qty = st.number_input("数量", value=50, step=10, min_value=1)
+
+            if st.form_submit_button("➕ 确认入库"):
+                # 比较时也强制转为字符串
+                keys = {"规格": str(spec), "长度": str(length), "类型": str(stype)}
+                if submit_write(SHEET_SCREW, add_or_accumulate(keys, qty, {"材质": "不锈钢", "备注": ""}),
+                                f"螺丝入库: {spec} +{qty}", INBOUND):
+                    data_changed()
+
+    # === 出库逻辑 (核心修复) ===
+    with tab_out:
+        st.caption("选择库存进行领用：")
+        if not df.empty:
+            # 按 ID 选择，只在渲染选项时拼显示文字。
+            # 文字里不放数量：后台写入合并后数量会变，选项文字一变选中项就会丢失
+            row_of = row_index(SHEET_SCREW, df)
+
+            with st.form("screw_out"):
+                selected_id = st.selectbox(
+                    "选择螺丝", list(row_of),
+                    format_func=lambda i: "{} {} {}".format(*df.loc[row_of[i], ['规格', '长度', '类型']])
+                )
+                out_qty = st.number_input("领用数量", value=1, step=1, min_value=1)
+
+                if st.form_submit_button("➖ 确认出库"):
+                    idx = row_of[selected_id]
+                    current_qty = df.at[idx, '数量']
+
+                    if current_qty < out_qty:
+                        st.error(f"库存不足！当前只有 {current_qty} 个")
+                    else:
+                        if submit_write(SHEET_SCREW, take_out(selected_id, out_qty),
+                                        f"出库成功！剩余 {current_qty - out_qty}", OUTBOUND):
+                            data_changed()
+        else:
+            st.warning("暂无库存可出")
+
+    st.divider()
+    if st.button("🔄 刷新数据", use_container_width=True):
+        invalidate(SHEET_SCREW)
+        data_changed()
+
+
+@st.fragment
+def screw_table():
+    df = load_data(SHEET_SCREW)
+    st.data_editor(
+        df,
+        use_container_width=True,
+        num_rows="dynamic",
+        height=500,
+        key="screw_editor",
+        column_config={ID_COL: None}
+    )
+    if st.button("💾 保存五金更改", type="primary"):
+        delta = st.session_state.get("screw_editor")
+        view = df
+        if has_changes(delta):
+            delta = assign_added_ids(delta)
+            if submit_write(SHEET_SCREW, lambda d: apply_editor_delta(d, view, delta), "✅ 五金已保存"):
+                data_changed()
+
+
 def render_screws():
     st.markdown("## 🔩 五金螺丝 (Google Sheets)")
     df = load_data(SHEET_SCREW)
@@ -239,91 +633,91 @@ def render_screws():
         st.info("初始化中...")
         return
 
-    c1, c2, c3 = st.columns(3)
-    c1.metric("📦 种类", len(df))
-    c2.metric("🔢 总数", df['数量'].sum())
-    c3.metric("⚠️ 缺货", len(df[df['数量'] < 20]), delta_color="inverse")
+    kpi_panel(SHEET_SCREW, ("📦 种类", "🔢 总数", "⚠️ 缺货"))
 
     st.markdown("---")
     col1, col2 = st.columns([1, 4])
-
     with col1:
-        tab_in, tab_out = st.tabs(["📥 入库", "📤 出库"])
-
-        # === 入库逻辑 ===
-        with tab_in:
-            with st.form("screw_add"):
-                # 强制转为字符串处理
-                spec = st.text_input("规格", placeholder="M3")
-                length = st.text_input("长度", placeholder="10mm")
-                stype = st.text_input("类型", placeholder="圆头")
-                qty = st.number_input("数量", value=50, step=10, min_value=1)
-
-                if st.form_submit_button("➕ 确认入库"):
-                    # 比较时也强制转为字符串
-                    mask = (df['规格'].astype(str) == str(spec)) & (df['长度'].astype(str) == str(length)) & (
-                            df['类型'].astype(str) == str(stype))
-                    if mask.any():
-                        df.loc[mask, '数量'] += qty
-                        st.toast(f"库存已增加: {spec} +{qty}")
+        screw_ops()
+    with col2:
+        screw_table()
+
+
+# ==================== 📟 PCB 电路板 (修复版) ====================
+@st.fragment
+def pcb_ops():
+    df = load_data(SHEET_PCB)
+    tab_in, tab_out = st.tabs(["📥 入库", "📤 出库"])
+
+    with tab_in:
+        with st.form("pcb_add"):
+            name = st.text_input("名称/版本号", placeholder="V1.0 主控板")
+            size = st.text_input("尺寸", placeholder="10x10cm")
+            loc = st.text_input("位置", placeholder="A-01")
+            qty = st.number_input("数量", value=5, step=1, min_value=1)
+
+            if st.form_submit_button("➕ 确认入库"):
+                keys = {"名称": str(name), "尺寸": str(size)}
+                if submit_write(SHEET_PCB, add_or_accumulate(keys, qty, {"位置": str(loc), "备注": ""}),
+                                f"PCB 入库: {name} +{qty}", INBOUND):
+                    data_changed()
+
+    with tab_out:
+        st.caption("选择 PCB 进行领用：")
+        if not df.empty:
+            row_of = row_index(SHEET_PCB, df)
+
+            with st.form("pcb_out"):
+                selected_id = st.selectbox(
+                    "选择板子", list(row_of),
+                    format_func=lambda i: "{} [{}]".format(*df.loc[row_of[i], ['名称', '尺寸']])
+                )
+                out_qty = st.number_input("领用数量", value=1, step=1, min_value=1)
+
+                if st.form_submit_button("➖ 确认出库"):
+                    idx = row_of[selected_id]
+                    current_qty = df.at[idx, '数量']
+
+                    if current_qty < out_qty:
+                        st.error(f"库存不足！仅剩 {current_qty}")
                     else:
-                        new_row = pd.DataFrame([{"规格": str(spec), "长度": str(length), "类型": str(stype),
-                                                 "材质": "不锈钢", "数量": qty, "备注": ""}])
-                        df = pd.concat([df, new_row], ignore_index=True)
-                        st.toast(f"新规格入库: {spec}")
-                    save_data(df, SHEET_SCREW)
-                    time.sleep(1)
-                    st.rerun()
-
-        # === 出库逻辑 (核心修复) ===
-        with tab_out:
-            st.caption("选择库存进行领用：")
-            if not df.empty:
-                # 👇👇👇 核心修复：这里也加了 .astype(str) 👇👇👇
-                df['display_name'] = df['规格'].astype(str) + " " + df['长度'].astype(str) + " " + df['类型'].astype(
-                    str) + " (余:" + df['数量'].astype(str) + ")"
-
-                with st.form("screw_out"):
-                    selected_item = st.selectbox("选择螺丝", df['display_name'].tolist())
-                    out_qty = st.number_input("领用数量", value=1, step=1, min_value=1)
-
-                    if st.form_submit_button("➖ 确认出库"):
-                        idx = df[df['display_name'] == selected_item].index[0]
-                        current_qty = df.at[idx, '数量']
-
-                        if current_qty < out_qty:
-                            st.error(f"库存不足！当前只有 {current_qty} 个")
-                        else:
-                            df.at[idx, '数量'] -= out_qty
-                            save_df = df.drop(columns=['display_name'])
-                            save_data(save_df, SHEET_SCREW)
-                            st.success(f"出库成功！剩余 {current_qty - out_qty}")
-                            time.sleep(1)
-                            st.rerun()
-            else:
-                st.warning("暂无库存可出")
+                        if submit_write(SHEET_PCB, take_out(selected_id, out_qty),
+                                        f"领用成功！剩余 {current_qty - out_qty}", OUTBOUND):
+                            data_changed()
+        else:
+            st.warning("暂无库存")
 
-        st.divider()
-        if st.button("🔄 刷新数据", use_container_width=True): st.rerun()
+    st.divider()
+    if st.button("🔄 刷新数据", use_container_width=True):
+        invalidate(SHEET_PCB)
+        data_changed()
 
-    with col2:
-        # 显示时不带辅助列
-        display_data = df.drop(columns=['display_name']) if 'display_name' in df.columns else df
-        edited_df = st.data_editor(
-            display_data,
-            use_container_width=True,
-            num_rows="dynamic",
-            height=500,
-            key="screw_editor"
-        )
-        if st.button("💾 保存五金更改", type="primary"):
-            if save_data(edited_df, SHEET_SCREW):
-                st.success("✅ 保存成功！")
-                time.sleep(1)
-                st.rerun()
+
+@st.fragment
+def pcb_table():
+    df = load_data(SHEET_PCB)
+    st.data_editor(
+        df,
+        use_container_width=True,
+        num_rows="dynamic",
+        height=500,
+        key="pcb_editor",
+        column_config={
+            "数量": st.column_config.NumberColumn("数量", min_value=0, step=1),
+            "尺寸": st.column_config.TextColumn("尺寸 (长x宽)"),
+            "名称": st.column_config.TextColumn("名称", required=True),
+            ID_COL: None,
+        }
+    )
+    if st.button("💾 保存PCB更改", type="primary"):
+        delta = st.session_state.get("pcb_editor")
+        view = df
+        if has_changes(delta):
+            delta = assign_added_ids(delta)
+            if submit_write(SHEET_PCB, lambda d: apply_editor_delta(d, view, delta), "✅ PCB 已保存"):
+                data_changed()
 
 
-# ==================== 📟 PCB 电路板 (修复版) ====================
 def render_pcb():
     st.markdown("## 📟 PCB 电路板 (Google Sheets)")
     df = load_data(SHEET_PCB)
@@ -332,90 +726,69 @@ def render_pcb():
         st.info("表格为空，请确保 Google Sheets 'pcbs' 表头包含：名称, 尺寸, 数量, 位置, 备注")
         if '名称' not in df.columns: return
 
-    c1, c2, c3 = st.columns(3)
-    c1.metric("📦 板子型号", len(df))
-    c2.metric("🔢 库存总数", df['数量'].sum())
-    c3.metric("⚠️ 低库存", len(df[df['数量'] < 5]), delta_color="inverse")
+    kpi_panel(SHEET_PCB, ("📦 板子型号", "🔢 库存总数", "⚠️ 低库存"))
 
     st.markdown("---")
     col1, col2 = st.columns([1, 4])
-
     with col1:
-        tab_in, tab_out = st.tabs(["📥 入库", "📤 出库"])
-
-        with tab_in:
-            with st.form("pcb_add"):
-                name = st.text_input("名称/版本号", placeholder="V1.0 主控板")
-                size = st.text_input("尺寸", placeholder="10x10cm")
-                loc = st.text_input("位置", placeholder="A-01")
-                qty = st.number_input("数量", value=5, step=1, min_value=1)
-
-                if st.form_submit_button("➕ 确认入库"):
-                    mask = (df['名称'].astype(str) == str(name)) & (df['尺寸'].astype(str) == str(size))
-                    if mask.any():
-                        df.loc[mask, '数量'] += qty
-                        st.toast(f"已累加: {name} +{qty}")
-                    else:
-                        new_row = pd.DataFrame(
-                            [{"名称": str(name), "尺寸": str(size), "数量": qty, "位置": str(loc), "备注": ""}])
-                        df = pd.concat([df, new_row], ignore_index=True)
-                        st.toast(f"新板入库: {name}")
-                    save_data(df, SHEET_PCB)
-                    time.sleep(1)
-                    st.rerun()
-
-        with tab_out:
-            st.caption("选择 PCB 进行领用：")
-            if not df.empty:
-                # 👇👇👇 核心修复：加了 .astype(str) 👇👇👇
-                df['display_info'] = df['名称'].astype(str) + " [" + df['尺寸'].astype(str) + "] (余:" + df[
-                    '数量'].astype(str) + ")"
-
-                with st.form("pcb_out"):
-                    selected_pcb = st.selectbox("选择板子", df['display_info'].tolist())
-                    out_qty = st.number_input("领用数量", value=1, step=1, min_value=1)
-
-                    if st.form_submit_button("➖ 确认出库"):
-                        idx = df[df['display_info'] == selected_pcb].index[0]
-                        current_qty = df.at[idx, '数量']
-
-                        if current_qty < out_qty:
-                            st.error(f"库存不足！仅剩 {current_qty}")
-                        else:
-                            df.at[idx, '数量'] -= out_qty
-                            save_df = df.drop(columns=['display_info'])
-                            save_data(save_df, SHEET_PCB)
-                            st.success(f"领用成功！剩余 {current_qty - out_qty}")
-                            time.sleep(1)
-                            st.rerun()
-            else:
-                st.warning("暂无库存")
+        pcb_ops()
+    with col2:
+        pcb_table()
 
-        st.divider()
-        if st.button("🔄 刷新数据", use_container_width=True): st.rerun()
 
-    with col2:
-        display_data = df.drop(columns=['display_info']) if 'display_info' in df.columns else df
-        edited_df = st.data_editor(
-            display_data,
-            use_container_width=True,
-            num_rows="dynamic",
-            height=500,
-            key="pcb_editor",
-            column_config={
-                "数量": st.column_config.NumberColumn("数量", min_value=0, step=1),
-                "尺寸": st.column_config.TextColumn("尺寸 (长x宽)"),
-                "名称": st.column_config.TextColumn("名称", required=True),
-            }
-        )
-        if st.button("💾 保存PCB更改", type="primary"):
-            if save_data(edited_df, SHEET_PCB):
-                st.success("✅ 保存成功！")
-                time.sleep(1)
-                st.rerun()
+# ==================== 📈 补货建议 ====================
+# 每张表在补货建议里显示的描述列
+REORDER_COLS = {SHEET_ELEC: ['名称', '参数', '封装', '位置'], SHEET_SCREW: ['规格', '长度', '类型'],
+                SHEET_PCB: ['名称', '尺寸', '位置']}
+
+
+@st.fragment
+def render_reorder():
+    st.markdown("## 📈 补货建议")
+    st.caption("按最近的实际消耗 (出库、手动改小) 估算还能用几天，以及要补多少才够用")
+
+    rollup = get_rollup(EVENT_DIR)
+    rollup.refresh()
+
+    c1, c2, c3, c4 = st.columns(4)
+    sheet = c1.selectbox("仓库", ALL_SHEETS, format_func=SHEET_LABELS.get)
+    window = c2.selectbox("按最近多少天计算", [7, 14, 28, 56, 90], index=2, format_func=lambda d: f"{d} 天")
+    lead_days = c3.number_input("到货周期 (天)", value=7, min_value=1, max_value=180)
+    cover_days = c4.number_input("补货后够用 (天)", value=30, min_value=1, max_value=365)
+
+    df = load_data(sheet)
+    if df.empty:
+        st.info("暂无数据")
+        return
+    plan = forecast(df, rollup.daily_rate(sheet, window), lead_days, cover_days, LOW_STOCK[sheet])
+    need = plan[plan['建议补货'] > 0]
+
+    k1, k2, k3 = st.columns(3)
+    k1.metric("🔴 到货前会断货", f"{(plan['可用天数'] < lead_days).sum()}")
+    k2.metric("🛒 需要补货", f"{len(need)}")
+    k3.metric("📉 有消耗记录", f"{(plan['日均消耗'] > 0).sum()}")
+
+    only_need = st.toggle("只看需要补货的", value=True)
+    view = need if only_need else plan
+    hist = rollup.weekly_history(sheet)
+    cols = [c for c in REORDER_COLS[sheet] if c in view.columns]
+    view = view[[ID_COL, '状态'] + cols + ['数量', '日均消耗', '可用天数', '建议补货']].copy()
+    view['近8周消耗'] = [hist.get(i, [0] * 8) for i in view[ID_COL]]
+    st.dataframe(
+        view, hide_index=True, use_container_width=True, height=600,
+        column_config={
+            ID_COL: None,
+            "可用天数": st.column_config.NumberColumn("可用天数", format="%.1f", help="∞ 表示最近没有消耗"),
+            "近8周消耗": st.column_config.BarChartColumn("近8周消耗", y_min=0),
+        }
+    )
 
 
 # ==================== 🚀 主入口 ====================
+# 登录后的第一次运行：并发预取三张表
+if 'sheet_cache' not in st.session_state:
+    prefetch_all()
+
 with st.sidebar:
     st.title("☁️ 云端管家")
 
@@ -424,16 +797,44 @@ with st.sidebar:
         st.write(f"👤 当前用户: **{st.session_state.username}**")
         if st.button("🚪 退出登录"):
             st.session_state.logged_in = False
+            st.session_state.pop('sheet_cache', None)
             st.rerun()
 
     st.markdown("---")
-    app_mode = st.radio("切换仓库", ["电子元器件", "五金螺丝", "PCB电路板"], label_visibility="collapsed")
+    app_mode = st.radio("切换仓库", ["电子元器件", "五金螺丝", "PCB电路板", "补货建议"], label_visibility="collapsed")
     st.markdown("---")
     st.caption(f"Status: Online 🟢\nDatabase: Google Sheets")
+    for err in st.session_state.pop('write_errors', []):
+        st.error(err)
+
+    # 导出复用已缓存的表，逐行写出，点击下载时才生成
+    with st.expander("📤 报表导出"):
+        ex_sheet = st.selectbox("数据", ALL_SHEETS, format_func=SHEET_LABELS.get, key="ex_sheet")
+        ex_kind = st.selectbox("报表", list(REPORTS), format_func=REPORTS.get, key="ex_kind")
+        ex_fmt = st.selectbox("格式", list(FORMATS), key="ex_fmt")
+        entry = st.session_state.get('sheet_cache', {}).get(ex_sheet)
+        ex_df = entry['df'] if entry else load_data(ex_sheet)
+        st.download_button(
+            "⬇️ 生成并下载",
+            data=lambda: export_to_tempfile(
+                build_report(ex_kind, *iter_frame(ex_df), LOW_STOCK[ex_sheet], SHEET_LABELS[ex_sheet], ex_fmt), ex_fmt),
+            file_name=export_filename(SHEET_LABELS[ex_sheet], ex_kind, ex_fmt), mime=FORMATS[ex_fmt],
+            use_container_width=True
+        )
+
+    if st.session_state.get('sheet_timing'):
+        st.caption("⏱ 读取耗时: " + " | ".join(
+            f"{name} {sec:.2f}s" for name, sec in st.session_state.sheet_timing.items()))
 
 if app_mode == "电子元器件":
     render_electronics()
 elif app_mode == "五金螺丝":
     render_screws()
+elif app_mode == "PCB电路板":
+    render_pcb()
 else:
-    render_pcb()
\ No newline at end of file
+    render_reorder()
+
+# 写入状态放在最后渲染：它在写入完成时会触发整页刷新，不能抢在本次点击被处理之前
+with st.sidebar:
+    st.fragment(write_status, run_every=1 if st.session_state.get('pending_writes') else None)()
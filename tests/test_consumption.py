@@ -0,0 +1,57 @@
+import pandas as pd
+
+from consumption import ConsumptionRollup
+from stock_events import EventLog, StockEvent, diff_events, MANUAL_EDIT, OUTBOUND, REMOVED
+from row_ids import ID_COL
+
+
+def test_deleted_rows_are_not_consumption(tmp_path):
+    log = EventLog(str(tmp_path / 'events'))
+    old = pd.DataFrame({ID_COL: ['a', 'b'], '名称': ['R', 'C'], '数量': [50, 80]})
+    new = pd.DataFrame({ID_COL: ['a'], '名称': ['R'], '数量': [30]})
+    events = diff_events(old, new, 'electronics', MANUAL_EDIT)
+    assert {e.part_id: e.kind for e in events} == {'a': MANUAL_EDIT, 'b': REMOVED}
+    log.append(events)
+
+    rollup = ConsumptionRollup(log, str(tmp_path / 'rollup'))
+    assert rollup.refresh() == 2
+    rate = rollup.daily_rate('electronics', 10)
+    assert rate.to_dict() == {'a': 2.0}
+
+
+def _outbound(part_id, qty):
+    return StockEvent(OUTBOUND, 'screws', part_id, -qty, 0)
+
+
+def test_refresh_appends_deltas_and_reload_replays_them(tmp_path):
+    log = EventLog(str(tmp_path / 'events'))
+    rollup = ConsumptionRollup(log, str(tmp_path / 'rollup'))
+    log.append([_outbound('a', 3)])
+    rollup.refresh()  # 当天第一次刷新：写完整汇总
+    log.append([_outbound('a', 4), _outbound('b', 7)])
+    rollup.refresh()
+    log.append([_outbound('b', 7)])
+    rollup.refresh()
+    assert rollup.daily_rate('screws', 7).to_dict() == {'a': 1.0, 'b': 2.0}
+    with open(rollup.delta_path, encoding='utf-8') as f:
+        assert len(f.readlines()) == 2
+
+    again = ConsumptionRollup(log, str(tmp_path / 'rollup'))
+    assert again.refresh() == 0
+    assert again.daily_rate('screws', 7).to_dict() == {'a': 1.0, 'b': 2.0}
+    assert again.weekly_history('screws', 1) == {'a': [7], 'b': [14]}
+
+
+def test_torn_delta_line_is_recounted_from_the_log(tmp_path):
+    log = EventLog(str(tmp_path / 'events'))
+    rollup = ConsumptionRollup(log, str(tmp_path / 'rollup'))
+    log.append([_outbound('a', 3)])
+    rollup.refresh()
+    log.append([_outbound('a', 4)])
+    rollup.refresh()
+    with open(rollup.delta_path, 'r+', encoding='utf-8') as f:
+        f.truncate(len(f.read()) - 5)
+
+    again = ConsumptionRollup(log, str(tmp_path / 'rollup'))
+    assert again.refresh() == 1
+    assert again.daily_rate('screws', 7).to_dict() == {'a': 1.0}
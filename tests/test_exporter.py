@@ -0,0 +1,34 @@
+import io
+import json
+
+from openpyxl import load_workbook
+
+from exporter import build_report, export
+
+HEADER = ['名称', '位置', '数量']
+ROWS = [['a', 'B', 1], ['b', 'A', 2], ['c', None, 5], ['d', 'B', 4], ['e', 'A', 3]]
+
+
+def _export(fmt):
+    fp = io.BytesIO()
+    export(build_report('stocktake', HEADER, iter(ROWS), fmt=fmt), fmt, fp)
+    fp.seek(0)
+    return fp
+
+
+def test_stocktake_groups_by_location_unassigned_last():
+    lines = [json.loads(line) for line in _export('jsonl').read().decode('utf-8').splitlines()]
+    assert [(r['位置'], r['名称']) for r in lines] == [('A', 'b'), ('A', 'e'), ('B', 'a'), ('B', 'd'), ('', 'c')]
+    assert all(r['实盘数量'] is None for r in lines)
+
+
+def test_stocktake_csv_matches_jsonl_order():
+    lines = _export('csv').read().decode('utf-8-sig').splitlines()
+    assert lines[0] == '位置,名称,数量,实盘数量'
+    assert [line.split(',')[1] for line in lines[1:]] == ['b', 'e', 'a', 'd', 'c']
+
+
+def test_stocktake_xlsx_one_sheet_per_location():
+    wb = load_workbook(_export('xlsx'))
+    names = {name: [row[1] for row in wb[name].iter_rows(min_row=2, values_only=True)] for name in wb.sheetnames}
+    assert names == {'B': ['a', 'd'], '未分配': ['c'], 'A': ['b', 'e']}
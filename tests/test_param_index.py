@@ -0,0 +1,81 @@
+import pandas as pd
+import pytest
+
+from param_index import ParamIndex, parse_param, parse_si
+from row_ids import ID_COL
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("4K7", ('Ω', 4700.0)),
+    ("4R7", ('Ω', 4.7)),
+    ("4.7kΩ", ('Ω', 4700.0)),
+    ("10 ohm", ('Ω', 10.0)),
+    ("100nF", ('F', 100e-9)),
+    ("10uF 25V", ('F', 10e-6)),
+    ("16V", ('V', 16.0)),
+    ("2.2 k", ('Ω', 2200.0)),
+    ("1M", ('Ω', 1e6)),
+    ("1.5", ('', 1.5)),
+    # 封装号在前，不能和后面的数值拼在一起
+    ("0603 4.7K", ('Ω', 4700.0)),
+    ("0603 10K", ('Ω', 10000.0)),
+    ("100 4.7uF", ('F', 4.7e-6)),
+])
+def test_parse_param(text, expected):
+    family, value = parse_param(text)
+    assert family == expected[0]
+    assert value == pytest.approx(expected[1])
+
+
+@pytest.mark.parametrize("text", ["", "nan", "abc", "4.7K7"])
+def test_parse_param_unrecognized(text):
+    assert parse_param(text) is None
+
+
+def test_parse_si():
+    assert parse_si("4.7k") == pytest.approx(4700)
+    assert parse_si("22K") == pytest.approx(22000)
+    assert parse_si("100n") == pytest.approx(100e-9)
+    assert parse_si("1e3") == 1000
+    assert parse_si("  ") is None
+    with pytest.raises(ValueError):
+        parse_si("abc")
+
+
+def _frame(rows):
+    return pd.DataFrame(rows, columns=[ID_COL, '参数'])
+
+
+def test_sync_add_change_remove():
+    index = ParamIndex()
+    index.sync(_frame([('a', '10K'), ('b', '4K7'), ('c', '100nF'), ('d', '???')]), token=1)
+    assert index.range('Ω') == ['b', 'a']
+    assert index.range('Ω', parse_si('5k')) == ['a']
+    assert index.families() == {'Ω': 2, 'F': 1}
+
+    # 改参数、删一行、加一行
+    index.sync(_frame([('a', '1K'), ('c', '100nF'), ('d', '???'), ('e', '22K')]), token=2)
+    assert index.range('Ω') == ['a', 'e']
+    assert index.range('Ω', 500, 2000) == ['a']
+    assert index.range('F') == ['c']
+
+    # 版本号相同则不再比对
+    index.sync(_frame([('z', '1V')]), token=2)
+    assert 'V' not in index.families()
+
+    # 单位族换了 (电阻 → 电容)，旧族里不能再留着它
+    index.sync(_frame([('a', '1uF'), ('c', '100nF'), ('e', '22K')]), token=3)
+    assert index.range('F') == ['c', 'a']
+    assert index.range('Ω') == ['e']
+
+
+def test_sync_rebuild_matches_incremental():
+    rows = [(f'r{i}', f'{i % 50}K') for i in range(200)]
+    incremental = ParamIndex()
+    incremental.sync(_frame(rows[:150]), token=1)
+    incremental.sync(_frame(rows), token=2)  # 变化不多，逐条插入
+    rebuilt = ParamIndex()
+    rebuilt.sync(_frame(rows), token=1)
+    # 数值相同的行之间先后不定，按集合比较
+    assert sorted(incremental.range('Ω', 10e3, 20e3)) == sorted(rebuilt.range('Ω', 10e3, 20e3))
+    assert incremental.families() == rebuilt.families()
@@ -0,0 +1,56 @@
+import pandas as pd
+
+from row_ids import ID_COL, apply_editor_delta, assign_added_ids, ensure_ids, has_changes
+
+
+def _table():
+    # 非默认的行标签：模拟删过行、没有 reset_index 的表
+    return pd.DataFrame({
+        ID_COL: ['a', 'b', 'c', 'd'],
+        '名称': ['R1', 'C1', 'R2', 'C2'],
+        '类型': ['电阻', '电容', '电阻', '电容'],
+        '数量': [10, 20, 30, 40],
+    }, index=[7, 3, 11, 5])
+
+
+def test_edit_and_delete_through_filtered_sorted_view():
+    df = _table()
+    view = df[df['类型'] == '电阻'].sort_values('数量', ascending=False)  # c, a
+    delta = {'edited_rows': {'1': {'数量': 99}}, 'added_rows': [], 'deleted_rows': [0]}
+    out = apply_editor_delta(df, view, delta)
+    assert dict(zip(out[ID_COL], out['数量'])) == {'a': 99, 'b': 20, 'd': 40}
+    assert df.loc[7, '数量'] == 10  # 原表不变
+
+
+def test_added_rows_keep_preassigned_ids():
+    df = _table()
+    delta = assign_added_ids({'edited_rows': {}, 'deleted_rows': [],
+                              'added_rows': [{'名称': 'L1', '数量': 5}, {}]})
+    first = apply_editor_delta(df, df, delta)
+    # 调度器在云端最新数据上重放同一份增量 (这里那边已经少了一行)
+    second = apply_editor_delta(df.drop(index=3), df, delta)
+    new_first = set(first[ID_COL]) - set(df[ID_COL])
+    new_second = set(second[ID_COL]) - set(df[ID_COL])
+    assert len(new_first) == 1
+    assert new_first == new_second
+    assert len(first) == len(df) + 1  # 空行不算新增
+
+
+def test_blank_quantity_is_coerced():
+    df = _table()
+    delta = {'edited_rows': {'0': {'数量': None}, '1': {'数量': 'abc'}}, 'deleted_rows': [],
+             'added_rows': [{'名称': 'X'}]}
+    out = apply_editor_delta(df, df, delta)
+    qty = dict(zip(out['名称'], out['数量']))
+    assert qty['R1'] == 0 and qty['C1'] == 0 and qty['X'] == 0
+    assert out['数量'].dtype.kind == 'i'
+
+
+def test_ensure_ids_and_has_changes():
+    df = pd.DataFrame({ID_COL: ['a', 'a', ''], '数量': [1, 2, 3]})
+    assert ensure_ids(df)
+    assert df[ID_COL].is_unique
+    assert not ensure_ids(df)
+    assert not has_changes(None)
+    assert not has_changes({'edited_rows': {}, 'added_rows': [], 'deleted_rows': []})
+    assert has_changes({'deleted_rows': [0]})
@@ -0,0 +1,54 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+from snapshot import LOCK_STALE, SnapshotStore
+
+
+def test_blank_text_cells_round_trip_as_empty_strings(tmp_path):
+    df = pd.DataFrame({'名称': ['R1', None], '数量': [5, None]}).astype({'名称': 'str'})
+    store = SnapshotStore(str(tmp_path))
+    version = store.publish('electronics', df)
+    got_version, got = store.get('electronics')
+    assert got_version == version
+    assert got['名称'].tolist() == ['R1', '']
+    assert got['数量'].tolist() == [5, 0]
+
+
+def test_pointer_keeps_the_mtime_given_at_write_time(tmp_path):
+    src = tmp_path / 'inv.xlsx'
+    src.write_bytes(b'v1')
+    written = os.stat(src).st_mtime_ns
+    os.utime(src, ns=(written + 10**9, written + 10**9))  # 发布前被别人改过
+    store = SnapshotStore(str(tmp_path / 'snap'))
+    store.publish('electronics', pd.DataFrame({'数量': [1]}), str(src), written)
+    assert store.version('electronics', str(src)) is None
+
+
+def test_concurrent_publishes_never_move_the_pointer_back(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    df = pd.DataFrame({'名称': ['R1'], '数量': [1]})
+    versions = []
+
+    def worker():
+        for _ in range(10):
+            versions.append(store.publish('electronics', df))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert store.version('electronics') == max(versions)
+    assert not os.path.exists(tmp_path / 'electronics.lock')
+
+
+def test_stale_lock_is_broken(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    lock = tmp_path / 'electronics.lock'
+    lock.write_bytes(b'')
+    old = time.time() - LOCK_STALE - 1
+    os.utime(lock, (old, old))
+    assert store.publish('electronics', pd.DataFrame({'数量': [1]})) == 1
@@ -0,0 +1,116 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from write_scheduler import WriteScheduler, is_quota_error
+
+
+class FakeSheet:
+    """假的云端表：记录读写次数，可注入写入失败"""
+
+    def __init__(self, qty=100):
+        self.df = pd.DataFrame({'ID': ['a'], '数量': [qty]})
+        self.reads = 0
+        self.writes = 0
+        self.write_errors = []  # 依次抛出的异常
+        self.gate = None        # threading.Event，设置后写入会阻塞到它被 set
+
+    def read(self, sheet):
+        self.reads += 1
+        return self.df.copy()
+
+    def write(self, sheet, df):
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.write_errors:
+            raise self.write_errors.pop(0)
+        self.writes += 1
+        self.df = df.copy()
+
+
+def add(n):
+    def mutation(df):
+        df = df.copy()
+        df.loc[0, '数量'] += n
+        return df
+    return mutation
+
+
+def fail(df):
+    raise ValueError("库存不足")
+
+
+def _scheduler(sheet, **kw):
+    kw.setdefault('window', 0.2)
+    return WriteScheduler(sheet.read, sheet.write, rate=1000, burst=1000, **kw)
+
+
+def test_writes_within_window_merge_into_one_flush():
+    sheet = FakeSheet()
+    sched = _scheduler(sheet)
+    futs = [sched.submit('s', add(i)) for i in (1, 2, 3)]
+    assert sched.drain(5)
+    assert (sheet.reads, sheet.writes) == (1, 1)
+    assert [f.result() for f in futs] == [1, 1, 1]
+    assert sheet.df.loc[0, '数量'] == 106
+    assert sched.latest('s')[0] == 1
+
+
+def test_failing_mutation_only_fails_its_own_future():
+    sheet = FakeSheet()
+    committed = []
+    sched = _scheduler(sheet)
+    ok1 = sched.submit('s', add(5), on_commit=lambda: committed.append(1))
+    bad = sched.submit('s', fail, on_commit=lambda: committed.append('bad'))
+    ok2 = sched.submit('s', add(7))
+    assert sched.drain(5)
+    assert ok1.result() == ok2.result() == 1
+    with pytest.raises(ValueError):
+        bad.result()
+    assert committed == [1]
+    assert sheet.df.loc[0, '数量'] == 112
+    assert sched.stats['failed'] == 1
+
+
+def test_quota_errors_back_off_and_retry():
+    sheet = FakeSheet()
+    sheet.write_errors = [Exception("429 RATE_LIMIT_EXCEEDED"), Exception("Quota exceeded")]
+    sched = _scheduler(sheet, window=0.01, base_delay=0.01)
+    fut = sched.submit('s', add(1))
+    assert fut.result(5) == 1
+    assert sched.stats['retries'] == 2
+    assert sheet.reads == 3  # 每次重试都基于重新读取的数据
+    assert sheet.df.loc[0, '数量'] == 101
+
+
+def test_other_errors_fail_the_batch_without_retry():
+    sheet = FakeSheet()
+    sheet.write_errors = [RuntimeError("boom")]
+    sched = _scheduler(sheet, window=0.01, base_delay=0.01)
+    futs = [sched.submit('s', add(1)), sched.submit('s', add(2))]
+    assert sched.drain(5)
+    for f in futs:
+        with pytest.raises(RuntimeError):
+            f.result()
+    assert sched.stats['retries'] == 0
+    assert sheet.df.loc[0, '数量'] == 100
+
+
+def test_drain_waits_for_in_flight_writes():
+    sheet = FakeSheet()
+    sheet.gate = threading.Event()
+    sched = _scheduler(sheet, window=0.01)
+    fut = sched.submit('s', add(1))
+    assert not sched.drain(0.3)  # 写入被挡住，超时返回 False
+    assert not fut.done()
+    assert sched.pending() == 1
+    sheet.gate.set()
+    assert sched.drain(5)
+    assert fut.result() == 1
+    assert sched.pending() == 0
+
+
+def test_is_quota_error():
+    assert is_quota_error(Exception("RESOURCE_EXHAUSTED"))
+    assert not is_quota_error(ValueError("库存不足"))
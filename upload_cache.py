@@ -0,0 +1,99 @@
+"""上传文件的解析缓存
+
+上传的 Excel 按内容 (sha256) 只解析一次，调整列映射、点按钮引起的 rerun 直接命中缓存；
+同名但内容改过的文件哈希不同，不会拿到旧结果。BOM 按 (哈希, 列映射) 缓存整理后的行，
+匹配结果再加上库存版本号缓存。所有缓存都是进程内共享、按最近使用淘汰的 LRU。
+"""
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存，超过 maxsize 时淘汰最久未用的条目"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def pop(self, key):
+        with self.lock:
+            return self._data.pop(key, None)
+
+    def get_or_compute(self, key, fn):
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, fn())  # 计算放在锁外，慢的解析不会挡住其他会话
+        return value
+
+
+# 上传文件 file_id → 内容哈希 (同一次上传不必每次 rerun 都重新算哈希)
+_HASHES = LRUCache(64)
+# 内容哈希 → 解析后的 DataFrame
+PARSED = LRUCache(8)
+# (哈希, 列映射) → 整理后的 BOM 行
+BOM_ROWS = LRUCache(32)
+# (哈希, 列映射, 库存版本) → 匹配结果
+MATCHES = LRUCache(32)
+
+
+def content_hash(uploaded):
+    """上传文件内容的 sha256"""
+    file_id = getattr(uploaded, 'file_id', None)
+    digest = _HASHES.get(file_id) if file_id else None
+    if digest is None:
+        digest = hashlib.sha256(uploaded.getvalue()).hexdigest()
+        if file_id:
+            _HASHES.put(file_id, digest)
+    return digest
+
+
+def read_upload(uploaded):
+    """解析上传的 Excel，返回 (内容哈希, DataFrame)。返回的表是共享的缓存，只读使用"""
+    digest = content_hash(uploaded)
+    df = PARSED.get_or_compute(digest, lambda: pd.read_excel(io.BytesIO(uploaded.getvalue())))
+    return digest, df
+
+
+def _cell(row, col):
+    """映射到 "(无)" 的列返回空字符串，其余去掉首尾空白，nan 视为空"""
+    if col == "(无)" or str(row[col]) == 'nan':
+        return ""
+    return str(row[col]).strip()
+
+
+def bom_rows(digest, df_bom, mapping):
+    """按列映射 (名称, 参数, 数量, 封装) 整理 BOM：跳过空行和 "无货"，数量无法识别时按 1"""
+    t_name, t_param, t_qty, t_pkg = mapping
+
+    def build():
+        rows = []
+        for _, row in df_bom.iterrows():
+            name = str(row[t_name]).strip()
+            if not name or "无货" in name: continue
+            try:
+                q = int(row[t_qty])
+            except (TypeError, ValueError):
+                q = 1
+            rows.append({'name': name, 'param': _cell(row, t_param), 'pkg': _cell(row, t_pkg), 'qty': q})
+        return rows
+    return BOM_ROWS.get_or_compute((digest, tuple(mapping)), build)
@@ -0,0 +1,167 @@
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+
+# ==================== 📮 云端写入调度器 ====================
+# 每次入库 / 出库 / 保存都不再直接 conn.update，而是把"修改函数"交给调度器：
+#   - 按工作表排队，短时间窗口内到达的修改合并成一次 读取 → 依次应用 → 写回
+#   - 令牌桶限速，遇到配额错误 (429 / RATE_LIMIT) 指数退避后重试
+#   - submit 立即返回 Future，界面稍后查询结果，不需要 sleep 等待
+
+_instances = weakref.WeakSet()
+
+
+class TokenBucket:
+    """令牌桶：平均每秒 rate 次，最多攒 capacity 次突发"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                time.sleep((1 - self.tokens) / self.rate)
+
+
+def is_quota_error(e):
+    """判断是否为 Sheets API 的限流 / 配额错误"""
+    status = getattr(getattr(e, 'response', None), 'status_code', None)
+    if status == 429:
+        return True
+    text = str(e)
+    return any(k in text for k in ('429', 'RATE_LIMIT', 'RESOURCE_EXHAUSTED', 'Quota exceeded'))
+
+
+class WriteScheduler:
+    """按工作表合并写入的后台调度器
+
+    read_fn(sheet) 返回云端最新的 DataFrame，write_fn(sheet, df) 写回整张表。
+    修改函数 mutation(df) 必须返回新表、不修改传入的表；抛出异常时只让它自己的 Future 失败。
+    """
+
+    def __init__(self, read_fn, write_fn, rate=0.8, burst=5, window=0.5, max_retries=5, base_delay=1.0):
+        self.read_fn = read_fn
+        self.write_fn = write_fn
+        self.window = window
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.bucket = TokenBucket(rate, burst)
+        self.stats = {'submitted': 0, 'flushes': 0, 'retries': 0, 'failed': 0}
+        self._queues = {}
+        self._first_at = {}
+        self._latest = {}
+        self._busy = False
+        self._cond = threading.Condition()
+        threading.Thread(target=self._loop, name="sheet-writer", daemon=True).start()
+        _instances.add(self)
+
+    def submit(self, sheet, mutation, on_commit=None):
+        """排入一个修改，返回 Future (成功时结果为写入后的版本号)
+
+        on_commit() 在这个修改真正写入云端之后调用 (例如记录库存事件)。
+        """
+        fut = Future()
+        with self._cond:
+            self._first_at.setdefault(sheet, time.monotonic())
+            self._queues.setdefault(sheet, []).append((mutation, fut, on_commit))
+            self.stats['submitted'] += 1
+            self._cond.notify_all()
+        return fut
+
+    def latest(self, sheet):
+        """调度器最近一次写入的 (版本号, DataFrame)，还没写过时为 (0, None)"""
+        with self._cond:
+            return self._latest.get(sheet, (0, None))
+
+    def pending(self):
+        with self._cond:
+            return sum(len(q) for q in self._queues.values()) + (1 if self._busy else 0)
+
+    def drain(self, timeout=None):
+        """等待队列全部写完 (脚本 / 压测收尾用)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queues or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._queues:
+                    self._cond.wait()
+                sheet, first = min(self._first_at.items(), key=lambda kv: kv[1])
+                wait = first + self.window - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                batch = self._queues.pop(sheet)
+                del self._first_at[sheet]
+                self._busy = True
+            try:
+                self._flush(sheet, batch)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _flush(self, sheet, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.bucket.take()
+                df = self.read_fn(sheet)
+                ok, failed = [], []
+                for mutation, fut, on_commit in batch:
+                    try:
+                        df = mutation(df)
+                        ok.append((fut, on_commit))
+                    except Exception as e:
+                        failed.append((fut, e))
+                version = None
+                if ok:
+                    self.bucket.take()
+                    self.write_fn(sheet, df)
+                    with self._cond:
+                        version = self._latest.get(sheet, (0, None))[0] + 1
+                        self._latest[sheet] = (version, df)
+                    self.stats['flushes'] += 1
+                for fut, on_commit in ok:
+                    if on_commit is not None:
+                        try:
+                            on_commit()
+                        except Exception:
+                            pass  # 回调失败不影响已经成功的写入
+                    fut.set_result(version)
+                for fut, e in failed:
+                    self.stats['failed'] += 1
+                    fut.set_exception(e)
+                return
+            except Exception as e:
+                if is_quota_error(e) and attempt < self.max_retries:
+                    self.stats['retries'] += 1
+                    time.sleep(self.base_delay * 2 ** attempt + random.uniform(0, self.base_delay))
+                    continue
+                for _, fut, _ in batch:
+                    self.stats['failed'] += 1
+                    fut.set_exception(e)
+                return
+
+
+def drain_all(timeout=None):
+    """等待进程内所有调度器写完"""
+    return all(s.drain(timeout) for s in list(_instances))
@@ -1,7 +1,7 @@
 # -*- mode: python ; coding: utf-8 -*-
 from PyInstaller.utils.hooks import collect_all
 
-datas = [('inventory_app.py', '.')]
+datas = [('inventory_app.py', '.'), ('row_ids.py', '.'), ('exporter.py', '.'), ('stock_events.py', '.'), ('snapshot.py', '.'), ('param_index.py', '.'), ('consumption.py', '.'), ('upload_cache.py', '.'), ('bg_assets.py', '.')]
 binaries = []
 hiddenimports = []
 tmp_ret = collect_all('streamlit')